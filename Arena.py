@@ -1,7 +1,12 @@
 import logging
+import math
+import multiprocessing as mp
+import time
 
 from tqdm import tqdm
 
+from utils import childThreadLimit
+
 log = logging.getLogger(__name__)
 
 
@@ -64,9 +69,9 @@ class Arena():
             board, curPlayer = self.game.getNextState(board, curPlayer, action)
 
             if verbose and curPlayer == -1:
-                print("Action", board.move_map_player_1.inverse[action], "Captures ", str(board.captures))
+                print("Action", board.move_table.get_move(action, player=1), "Captures ", str(board.captures))
             elif verbose:
-                print("Action", board.move_map_player_0.inverse[action], "Captures ", str(board.captures))
+                print("Action", board.move_table.get_move(action, player=0), "Captures ", str(board.captures))
 
             if display:
                 board.visualise(show_coords=True, title=f"Turn {it}")
@@ -114,3 +119,121 @@ class Arena():
                 draws += 1
 
         return oneWon, twoWon, draws
+
+
+class ParallelArena(Arena):
+    """
+    An Arena that plays its games in a pool of worker processes.
+
+    Instead of player functions, it takes two player factories: picklable
+    callables that take the game and return a player function. Each worker
+    process calls the factories once and uses the resulting players for all of
+    its games.
+    """
+
+    def __init__(self, player1, player2, game, numWorkers, stopWhen=None):
+        """
+        Input:
+            player 1,2: two factories that take the game as input and return a
+                        player function (that takes board as input, return
+                        action)
+            game: Game object
+            numWorkers: the number of worker processes to play games in
+            stopWhen: an optional function that takes the (oneWon, twoWon,
+                      draws) counts so far and returns True once the outcome
+                      of the match is decided (e.g. see sprt), stopping the
+                      remaining games early
+        """
+        super().__init__(player1, player2, game)
+        self.numWorkers = numWorkers
+        self.stopWhen = stopWhen
+        self.gameDurations = []
+
+    def playGames(self, num, verbose=False, display=False):
+        """
+        Plays num games in which player1 starts num/2 games and player2 starts
+        num/2 games, in parallel. The duration (in seconds) of every game that
+        was played is stored in gameDurations.
+
+        Returns:
+            oneWon: games won by player1
+            twoWon: games won by player2
+            draws:  games won by nobody
+        """
+        num = int(num / 2)
+        swaps = [False] * num + [True] * num
+
+        oneWon = 0
+        twoWon = 0
+        draws = 0
+        self.gameDurations = []
+
+        ctx = mp.get_context('spawn')
+        with childThreadLimit(1):
+            pool = ctx.Pool(self.numWorkers, initializer=initArenaWorker,
+                            initargs=(self.player1, self.player2, self.game))
+        with pool:
+            games = pool.imap_unordered(playArenaGame, [(swapped, verbose, display) for swapped in swaps])
+            for swapped, gameResult, duration in tqdm(games, total=len(swaps), desc="Arena.playGames"):
+                self.gameDurations.append(duration)
+                if swapped:
+                    gameResult = -gameResult
+
+                if gameResult == 1:
+                    oneWon += 1
+                elif gameResult == -1:
+                    twoWon += 1
+                else:
+                    draws += 1
+
+                if self.stopWhen is not None and self.stopWhen(oneWon, twoWon, draws):
+                    log.info(f'Stopping the arena early after {len(self.gameDurations)} of {len(swaps)} games')
+                    pool.terminate()
+                    break
+
+        return oneWon, twoWon, draws
+
+
+arenaPlayers = None  # the (player1, player2, game) of an arena worker process
+
+
+def initArenaWorker(player1, player2, game):
+    global arenaPlayers
+    arenaPlayers = (player1(game), player2(game), game)
+
+
+def playArenaGame(task):
+    """
+    Plays one game in an arena worker process, with player2 starting if swapped
+    is True.
+
+    Returns:
+        swapped, the result of Arena.playGame, and the duration of the game
+    """
+    swapped, verbose, display = task
+    player1, player2, game = arenaPlayers
+    if swapped:
+        player1, player2 = player2, player1
+
+    start = time.time()
+    gameResult = Arena(player1, player2, game).playGame(verbose=verbose, display=display)
+    return swapped, gameResult, time.time() - start
+
+
+def sprt(wins, losses, p0, p1, alpha=0.05, beta=0.05):
+    """
+    Performs a sequential probability ratio test of the hypothesis that a
+    player's win rate (ignoring draws) is p1 against the hypothesis that it is
+    p0 (with p0 < p1).
+
+    Returns:
+        1 if the win rate is p1 (or more), -1 if it is p0 (or less), and 0 if
+        more games are needed to decide
+    """
+    llr = wins * math.log(p1 / p0) + losses * math.log((1 - p1) / (1 - p0))
+    if llr >= math.log((1 - beta) / alpha):
+        return 1
+    elif llr <= math.log(beta / (1 - alpha)):
+        return -1
+    else:
+        return 0
@@ -1,15 +1,20 @@
 import logging
+import multiprocessing as mp
 import os
+import queue
+import random
 import sys
 from collections import deque
 from pickle import Pickler, Unpickler
-from random import shuffle
 
 import numpy as np
 from tqdm import tqdm
 
-from Arena import Arena
+from Arena import Arena, ParallelArena, sprt
+from InferenceServer import InferenceServer
 from MCTS import MCTS
+from ReplayBuffer import ReplayBuffer
+from utils import childThreadLimit, dotdict
 
 log = logging.getLogger(__name__)
 
@@ -23,11 +28,14 @@ class Coach():
     def __init__(self, game, nnet, args):
         self.game = game
         self.nnet = nnet
-        self.pnet = self.nnet.__class__(self.game)  # the competitor network
+        self.pnet = None  # the competitor network (created when first needed)
         self.args = args
         self.mcts = MCTS(self.game, self.nnet, self.args)
         self.trainExamplesHistory = []  # history of examples from args.numItersForTrainExamplesHistory latest iterations
         self.skipFirstSelfPlay = False  # can be overriden in loadTrainExamples()
+        self.replayBuffer = None  # on-disk store of the examples (used instead of trainExamplesHistory)
+        if self.args.get('replayBuffer', False):
+            self.replayBuffer = ReplayBuffer(os.path.join(self.args.checkpoint, 'replay'), self.game.getActionSize())
 
     def executeEpisode(self):
         """
@@ -42,8 +50,9 @@ class Coach():
 
         Returns:
             trainExamples: a list of examples of the form (canonicalBoard, currPlayer, pi,v)
-                           pi is the MCTS informed policy vector, v is +1 if
-                           the player eventually won the game, else -1.
+                           pi is the MCTS informed policy as a sparse
+                           (actions, probs) tuple, v is +1 if the player
+                           eventually won the game, else -1.
         """
         trainExamples = []
         board = self.game.getInitBoard()
@@ -55,12 +64,16 @@ class Coach():
             canonicalBoard = self.game.getCanonicalForm(board, self.curPlayer)
             temp = int(episodeStep < self.args.tempThreshold)
 
-            pi = self.mcts.getActionProb(canonicalBoard, temp=temp)
-            sym = self.game.getSymmetries(canonicalBoard, pi)
-            for b, p in sym:
-                trainExamples.append([b, self.curPlayer, p, None])
+            pi = self.mcts.getActionProb(canonicalBoard, temp=temp, sparse=True)
+            if self.args.get('augmentOnTheFly', False):
+                # the symmetrical forms are sampled when training instead
+                trainExamples.append([canonicalBoard, self.curPlayer, pi, None])
+            else:
+                sym = self.game.getSymmetries(canonicalBoard, pi)
+                for b, p in sym:
+                    trainExamples.append([b, self.curPlayer, p, None])
 
-            action = np.random.choice(len(pi), p=pi)
+            action = np.random.choice(pi[0], p=pi[1])
             board, self.curPlayer = self.game.getNextState(board, self.curPlayer, action)
 
             r = self.game.getGameEnded(board, self.curPlayer)
@@ -68,6 +81,78 @@ class Coach():
             if r != 0:
                 return [(x[0], x[2], r * ((-1) ** (x[1] != self.curPlayer))) for x in trainExamples]
 
+    def executeEpisodesParallel(self, iteration):
+        """
+        Plays numEps episodes of self-play across numSelfPlayWorkers worker
+        processes. Each worker loads the current network from a checkpoint and
+        plays its share of the episodes with a fresh MCTS per episode, sending
+        the examples of each episode back as soon as it ends.
+
+        The random state of every episode is seeded from (seed, iteration,
+        episode), so the examples do not depend on the number of workers.
+
+        If args.inferenceServer is set, the workers instead share a single
+        copy of the network that runs in an InferenceServer process, which
+        evaluates the boards of all the workers in batches.
+
+        Returns:
+            trainExamples: the examples of all the episodes, in episode order
+        """
+        self.nnet.save_checkpoint(folder=self.args.checkpoint, filename='selfplay.pth.tar')
+
+        numWorkers = self.args.numSelfPlayWorkers
+        ctx = mp.get_context('spawn')
+        results = ctx.Queue()
+        workers = []
+
+        server = None
+        if self.args.get('inferenceServer', False):
+            slotSize = self.args.get('mctsBatchSize', 1)
+            server = InferenceServer(ctx, self.game, self.nnet, (self.args.checkpoint, 'selfplay.pth.tar'), numWorkers,
+                                     slotSize=slotSize,
+                                     maxBatchSize=self.args.get('inferenceBatchSize', numWorkers * slotSize),
+                                     maxWait=self.args.get('inferenceMaxWait', 0.002))
+            server.start()
+
+        # Workers share the host's cores, so limit each one to a single thread
+        with childThreadLimit(1):
+            for w in range(numWorkers):
+                episodes = list(range(w, self.args.numEps, numWorkers))
+                client = server.client(w) if server is not None else None
+                worker = ctx.Process(target=selfPlayWorker,
+                                     args=(self.game, self.nnet.__class__, dict(self.args), iteration, episodes,
+                                           results, client),
+                                     daemon=True)
+                worker.start()
+                workers.append(worker)
+
+        episodeExamples = {}
+        try:
+            with tqdm(total=self.args.numEps, desc="Self Play") as t:
+                while len(episodeExamples) < self.args.numEps:
+                    try:
+                        episode, examples = results.get(timeout=1)
+                    except queue.Empty:
+                        if any(w.exitcode not in (None, 0) for w in workers):
+                            for w in workers:
+                                w.terminate()
+                            raise RuntimeError('A self-play worker exited unexpectedly')
+                        continue
+                    episodeExamples[episode] = examples
+                    t.update()
+
+            for w in workers:
+                w.join()
+        finally:
+            if server is not None:
+                log.info(f'Inference server stats: {server.stats()}')
+                server.stop()
+
+        trainExamples = []
+        for episode in sorted(episodeExamples):
+            trainExamples += episodeExamples[episode]
+        return trainExamples
+
     def learn(self):
         """
         Performs numIters iterations with numEps episodes of self-play in each
@@ -84,39 +169,58 @@ class Coach():
             if not self.skipFirstSelfPlay or i > 1:
                 iterationTrainExamples = deque([], maxlen=self.args.maxlenOfQueue)
 
-                for _ in tqdm(range(self.args.numEps), desc="Self Play"):
-                    self.mcts = MCTS(self.game, self.nnet, self.args)  # reset search tree
-                    iterationTrainExamples += self.executeEpisode()
+                if self.args.get('numSelfPlayWorkers', 1) > 1:
+                    iterationTrainExamples += self.executeEpisodesParallel(i)
+                else:
+                    for _ in tqdm(range(self.args.numEps), desc="Self Play"):
+                        self.mcts = MCTS(self.game, self.nnet, self.args)  # reset search tree
+                        iterationTrainExamples += self.executeEpisode()
 
-                # save the iteration examples to the history 
-                self.trainExamplesHistory.append(iterationTrainExamples)
+                if self.replayBuffer is not None:
+                    # write the iteration examples to disk (only this iteration's files)
+                    self.replayBuffer.addIteration(self.replayBuffer.nextIteration(), iterationTrainExamples)
+                else:
+                    # save the iteration examples to the history 
+                    self.trainExamplesHistory.append(iterationTrainExamples)
 
-            if len(self.trainExamplesHistory) > self.args.numItersForTrainExamplesHistory:
-                log.warning(
-                    f"Removing the oldest entry in trainExamples. len(trainExamplesHistory) = {len(self.trainExamplesHistory)}")
-                self.trainExamplesHistory.pop(0)
-            # backup history to a file
-            # NB! the examples were collected using the model from the previous iteration, so (i-1)  
-            self.saveTrainExamples(i - 1)
+            if self.replayBuffer is not None:
+                # the examples are shuffled when training
+                trainExamples = self.replayBuffer.window(self.args.numItersForTrainExamplesHistory)
+            else:
+                if len(self.trainExamplesHistory) > self.args.numItersForTrainExamplesHistory:
+                    log.warning(
+                        f"Removing the oldest entry in trainExamples. len(trainExamplesHistory) = {len(self.trainExamplesHistory)}")
+                    self.trainExamplesHistory.pop(0)
+                # backup history to a file
+                # NB! the examples were collected using the model from the previous iteration, so (i-1)  
+                self.saveTrainExamples(i - 1)
 
-            # shuffle examples before training
-            trainExamples = []
-            for e in self.trainExamplesHistory:
-                trainExamples.extend(e)
-            shuffle(trainExamples)
+                # the examples are shuffled when training (and are kept in order
+                # here, so that the validation slice holds the latest games)
+                trainExamples = []
+                for e in self.trainExamplesHistory:
+                    trainExamples.extend(e)
 
             # training new network, keeping a copy of the old one
+            if self.pnet is None:
+                self.pnet = self.nnet.__class__(self.game)
             self.nnet.save_checkpoint(folder=self.args.checkpoint, filename='temp.pth.tar')
             self.pnet.load_checkpoint(folder=self.args.checkpoint, filename='temp.pth.tar')
             pmcts = MCTS(self.game, self.pnet, self.args)
 
-            self.nnet.train(trainExamples)
+            self.nnet.train(trainExamples, augment=self.args.get('augmentOnTheFly', False))
             nmcts = MCTS(self.game, self.nnet, self.args)
 
             log.info('PITTING AGAINST PREVIOUS VERSION')
-            arena = Arena(lambda x: np.argmax(pmcts.getActionProb(x, temp=0)),
-                          lambda x: np.argmax(nmcts.getActionProb(x, temp=0)), self.game)
-            pwins, nwins, draws = arena.playGames(self.args.arenaCompare)
+            if self.args.get('numArenaWorkers', 1) > 1 or self.args.get('arenaSPRTDelta'):
+                arena = self.parallelArena()
+                pwins, nwins, draws = arena.playGames(self.args.arenaCompare)
+                log.info('ARENA GAME DURATIONS : mean %.1fs ; max %.1fs' % (np.mean(arena.gameDurations),
+                                                                            np.max(arena.gameDurations)))
+            else:
+                arena = Arena(lambda x: np.argmax(pmcts.getActionProb(x, temp=0)),
+                              lambda x: np.argmax(nmcts.getActionProb(x, temp=0)), self.game)
+                pwins, nwins, draws = arena.playGames(self.args.arenaCompare)
 
             log.info('NEW/PREV WINS : %d / %d ; DRAWS : %d' % (nwins, pwins, draws))
             if pwins + nwins == 0 or float(nwins) / (pwins + nwins) < self.args.updateThreshold:
@@ -127,6 +231,29 @@ class Coach():
                 self.nnet.save_checkpoint(folder=self.args.checkpoint, filename='best.pth.tar')
             self.nnet.save_checkpoint(folder=self.args.checkpoint, filename=self.getCheckpointFile(i))
 
+    def parallelArena(self):
+        """
+        Returns a ParallelArena that pits the previous network (saved in
+        temp.pth.tar) against the new network over numArenaWorkers processes.
+
+        If args.arenaSPRTDelta is set, the match stops as soon as a sequential
+        probability ratio test decides whether the new network's win rate is
+        above updateThreshold + arenaSPRTDelta or below updateThreshold -
+        arenaSPRTDelta.
+        """
+        self.nnet.save_checkpoint(folder=self.args.checkpoint, filename='arena.pth.tar')
+        args = dict(self.args)
+        previous = MCTSPlayer(self.nnet.__class__, (self.args.checkpoint, 'temp.pth.tar'), args)
+        new = MCTSPlayer(self.nnet.__class__, (self.args.checkpoint, 'arena.pth.tar'), args)
+
+        stopWhen = None
+        delta = self.args.get('arenaSPRTDelta')
+        if delta:
+            threshold = self.args.updateThreshold
+            stopWhen = lambda pwins, nwins, draws: sprt(nwins, pwins, threshold - delta, threshold + delta) != 0
+
+        return ParallelArena(previous, new, self.game, self.args.get('numArenaWorkers', 1), stopWhen=stopWhen)
+
     def getCheckpointFile(self, iteration):
         return 'checkpoint_' + str(iteration) + '.pth.tar'
 
@@ -140,6 +267,20 @@ class Coach():
         f.closed
 
     def loadTrainExamples(self):
+        if self.replayBuffer is not None:
+            self.replayBuffer = ReplayBuffer(os.path.join(self.args.load_folder_file[0], 'replay'),
+                                             self.game.getActionSize())
+            self.replayBuffer.load()
+            if len(self.replayBuffer) == 0:
+                log.warning(f'No iterations found in replay buffer "{self.replayBuffer.folder}"!')
+                r = input("Continue? [y|n]")
+                if r != "y":
+                    sys.exit()
+            else:
+                log.info(f'Loaded {len(self.replayBuffer)} iterations from the replay buffer.')
+                self.skipFirstSelfPlay = True
+            return
+
         modelFile = os.path.join(self.args.load_folder_file[0], self.args.load_folder_file[1])
         examplesFile = modelFile + ".examples"
         if not os.path.isfile(examplesFile):
@@ -155,3 +296,45 @@ class Coach():
 
             # examples based on the model were already collected (loaded)
             self.skipFirstSelfPlay = True
+
+
+class MCTSPlayer():
+    """
+    A picklable factory of MCTS players (for ParallelArena), which loads the
+    network from a checkpoint in the process that uses it.
+    """
+
+    def __init__(self, nnetClass, checkpoint, args):
+        self.nnetClass = nnetClass
+        self.checkpoint = checkpoint
+        self.args = args
+
+    def __call__(self, game):
+        nnet = self.nnetClass(game)
+        nnet.load_checkpoint(folder=self.checkpoint[0], filename=self.checkpoint[1])
+        mcts = MCTS(game, nnet, dotdict(self.args))
+        return lambda x: np.argmax(mcts.getActionProb(x, temp=0))
+
+
+def selfPlayWorker(game, nnetClass, args, iteration, episodes, results, client=None):
+    """
+    Plays the given self-play episodes with the network saved by
+    Coach.executeEpisodesParallel (or with the InferenceServer client, if one is
+    given), putting (episode, trainExamples) on the results queue as each
+    episode ends.
+    """
+    args = dotdict(args)
+    if client is not None:
+        nnet = client
+    else:
+        nnet = nnetClass(game)
+        nnet.load_checkpoint(folder=args.checkpoint, filename='selfplay.pth.tar')
+    coach = Coach(game, nnet, args)
+
+    for episode in episodes:
+        seed = np.random.SeedSequence([args.get('seed', 0), iteration, episode]).generate_state(1)[0]
+        np.random.seed(seed)
+        random.seed(int(seed))
+
+        coach.mcts = MCTS(game, nnet, args)  # reset search tree
+        results.put((episode, coach.executeEpisode()))
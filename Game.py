@@ -92,7 +92,8 @@ class Game():
         """
         Input:
             board: current board
-            pi: policy vector of size self.getActionSize()
+            pi: policy vector of size self.getActionSize(), or a sparse
+                (actions, probs) policy (see MCTS.getActionProb)
 
         Returns:
             symmForms: a list of [(board,pi)] where each tuple is a symmetrical
@@ -107,7 +108,8 @@ class Game():
             board: current board
 
         Returns:
-            boardString: a quick conversion of board to a string format.
+            boardString: a quick conversion of board to a string format (or
+                         any other hashable key, such as an integer hash).
                          Required by MCTS for hashing.
         """
         pass
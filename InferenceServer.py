@@ -0,0 +1,238 @@
+import queue
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from NeuralNet import NeuralNet
+
+
+class InferenceServer():
+    """
+    This class runs a single copy of a neural network in its own process and
+    evaluates boards for many client processes (e.g. self-play workers) in
+    dynamic batches.
+
+    Each client owns a slot of shared memory that holds its encoded boards and
+    the policies and values predicted for them, so only small request and
+    response messages travel between the processes. The server waits up to
+    maxWait seconds after the first pending request for more requests to fill a
+    batch of up to maxBatchSize boards.
+
+    The network must provide input_shape, encoder (a picklable object whose
+    encode(board) returns the input planes of a board, which is sent to the
+    clients) and predict_planes(planes), as blooms/pytorch/NNet.py does.
+    """
+
+    def __init__(self, ctx, game, nnet, checkpoint, numClients, slotSize=1, maxBatchSize=64, maxWait=0.002):
+        """
+        Input:
+            ctx: the multiprocessing context to start the server process with
+            game: Game object
+            nnet: the network (its class is instantiated in the server process)
+            checkpoint: a (folder, filename) tuple to load the network from
+            numClients: the number of clients that will use the server
+            slotSize: the maximum number of boards per client request
+            maxBatchSize: the maximum number of boards per forward pass
+            maxWait: the maximum time (in seconds) to wait for a batch to fill
+        """
+        self.ctx = ctx
+        self.game = game
+        self.nnetClass = nnet.__class__
+        self.encode = nnet.encoder.encode
+        self.checkpoint = checkpoint
+        self.numClients = numClients
+        self.slotSize = slotSize
+        self.maxBatchSize = maxBatchSize
+        self.maxWait = maxWait
+
+        inputShape = tuple(nnet.input_shape)
+        self.shapes = {
+            'planes': (numClients, slotSize) + inputShape,
+            'pis': (numClients, slotSize, game.getActionSize()),
+            'vs': (numClients, slotSize),
+        }
+        self.memory = {name: shared_memory.SharedMemory(create=True, size=int(np.prod(shape)) * 4)
+                       for name, shape in self.shapes.items()}
+
+        self.requests = ctx.Queue()
+        self.responses = [ctx.Pipe(duplex=False) for _ in range(numClients)]
+
+        # batches, boards, requests, total queue latency, max queue latency
+        self.counters = ctx.Array('d', 5)
+        self.process = None
+
+    def start(self):
+        """
+        Starts the server process.
+        """
+        self.process = self.ctx.Process(target=serveInference,
+                                        args=(self.game, self.nnetClass, self.checkpoint, self.specs(),
+                                              self.requests, [send for _, send in self.responses], self.counters,
+                                              self.maxBatchSize, self.maxWait),
+                                        daemon=True)
+        self.process.start()
+
+    def stop(self):
+        """
+        Stops the server process and releases the shared memory.
+        """
+        if self.process is not None:
+            self.requests.put(None)
+            self.process.join()
+            self.process = None
+
+        for memory in self.memory.values():
+            memory.close()
+            memory.unlink()
+
+    def client(self, clientId):
+        """
+        Returns:
+            client: the InferenceClient for the clientId-th client, which can be
+                    passed to a client process and used in place of the network
+        """
+        return InferenceClient(clientId, self.game.getActionSize(), self.encode, self.specs(),
+                               self.requests, self.responses[clientId][0])
+
+    def specs(self):
+        return {name: (memory.name, self.shapes[name]) for name, memory in self.memory.items()}
+
+    def stats(self):
+        """
+        Returns:
+            stats: a dict with the number of batches and requests served, the
+                   mean and max batch size and the mean and max time (in
+                   seconds) that requests waited before their batch started
+        """
+        batches, boards, requests, totalLatency, maxLatency = self.counters[:]
+        return {
+            'batches': int(batches),
+            'requests': int(requests),
+            'mean_batch_size': boards / batches if batches else 0.0,
+            'mean_queue_latency': totalLatency / requests if requests else 0.0,
+            'max_queue_latency': maxLatency,
+        }
+
+
+class InferenceClient(NeuralNet):
+    """
+    This class evaluates boards with an InferenceServer. It implements the
+    prediction methods of NeuralNet, so it can be given to MCTS in place of the
+    network.
+
+    NOTE: the arrays returned by predict and predict_batch are views of the
+    client's shared memory slot and are only valid until the next prediction.
+    """
+
+    def __init__(self, clientId, actionSize, encode, specs, requests, response):
+        self.clientId = clientId
+        self.actionSize = actionSize
+        self.encode = encode
+        self.specs = specs
+        self.requests = requests
+        self.response = response
+        self.memory = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['memory'] = None
+        return state
+
+    def attach(self):
+        self.memory, arrays = attachSharedArrays(self.specs)
+        self.planes, self.pis, self.vs = (arrays[name][self.clientId] for name in ('planes', 'pis', 'vs'))
+
+    def predict(self, board):
+        pis, vs = self.predict_batch([board])
+        return pis[0], vs[0]
+
+    def predict_batch(self, boards):
+        if self.memory is None:
+            self.attach()
+
+        slotSize = len(self.planes)
+        if len(boards) > slotSize:
+            # Evaluate the boards in chunks that fit in the slot
+            pis, vs = [], []
+            for i in range(0, len(boards), slotSize):
+                chunkPis, chunkVs = self.predict_batch(boards[i:i + slotSize])
+                pis.append(chunkPis.copy())
+                vs.append(chunkVs.copy())
+            return np.concatenate(pis), np.concatenate(vs)
+
+        for i, board in enumerate(boards):
+            self.planes[i] = self.encode(board)
+        self.requests.put((self.clientId, len(boards), time.time()))
+        self.response.recv()
+
+        return self.pis[:len(boards)], self.vs[:len(boards)]
+
+
+def attachSharedArrays(specs):
+    """
+    Attaches to the shared memory blocks described by specs (a dict of
+    name -> (shared memory name, shape)).
+
+    Returns:
+        memory: the SharedMemory objects (which must be kept alive)
+        arrays: a dict of name -> float32 array backed by the shared memory
+    """
+    memory = {name: shared_memory.SharedMemory(name=shmName) for name, (shmName, _) in specs.items()}
+    arrays = {name: np.ndarray(shape, dtype=np.float32, buffer=memory[name].buf)
+              for name, (_, shape) in specs.items()}
+    return memory, arrays
+
+
+def serveInference(game, nnetClass, checkpoint, specs, requests, responses, counters, maxBatchSize, maxWait):
+    """
+    The main loop of the InferenceServer process. Gathers requests into
+    batches, evaluates them and signals the clients, until a None request is
+    received.
+    """
+    nnet = nnetClass(game)
+    nnet.load_checkpoint(folder=checkpoint[0], filename=checkpoint[1])
+    memory, arrays = attachSharedArrays(specs)
+    planes, pis, vs = arrays['planes'], arrays['pis'], arrays['vs']
+
+    stopping = False
+    while not stopping:
+        request = requests.get()
+        if request is None:
+            break
+
+        # Wait (up to maxWait) for more requests to fill the batch
+        batch = [request]
+        size = request[1]
+        deadline = time.time() + maxWait
+        while size < maxBatchSize:
+            try:
+                request = requests.get(timeout=max(deadline - time.time(), 0))
+            except queue.Empty:
+                break
+            if request is None:
+                stopping = True
+                break
+            batch.append(request)
+            size += request[1]
+
+        start = time.time()
+        clients = np.concatenate([np.full(n, clientId) for clientId, n, _ in batch])
+        rows = np.concatenate([np.arange(n) for _, n, _ in batch])
+        batchPis, batchVs = nnet.predict_planes(planes[clients, rows])
+        pis[clients, rows] = batchPis
+        vs[clients, rows] = batchVs
+
+        for clientId, _, _ in batch:
+            responses[clientId].send(None)
+
+        latencies = [start - requestTime for _, _, requestTime in batch]
+        with counters.get_lock():
+            counters[0] += 1
+            counters[1] += size
+            counters[2] += len(batch)
+            counters[3] += sum(latencies)
+            counters[4] = max(counters[4], max(latencies))
+
+    for block in memory.values():
+        block.close()
@@ -8,6 +8,25 @@ EPS = 1e-8
 log = logging.getLogger(__name__)
 
 
+class Node():
+    """
+    This class stores the search statistics of an expanded (non-terminal)
+    state. The statistics of the edges leaving the state are kept in arrays
+    that are aligned with the valid actions of the state.
+    """
+    __slots__ = ('actions', 'P', 'N', 'Q', 'VL', 'visits', 'pending', 'children')
+
+    def __init__(self, actions, priors):
+        self.actions = actions  # the valid actions of the state
+        self.P = priors  # initial policy (returned by neural net) over the valid actions
+        self.N = np.zeros(len(actions), dtype=np.int64)  # #times each edge was visited
+        self.Q = np.zeros(len(actions))  # Q value of each edge (as defined in the paper)
+        self.VL = np.zeros(len(actions), dtype=np.int64)  # #pending (batched) searches through each edge
+        self.visits = 0  # #times the state was visited
+        self.pending = 0  # #pending (batched) searches through the state
+        self.children = {}  # the board s reached by each visited edge
+
+
 class MCTS():
     """
     This class handles the MCTS tree.
@@ -17,42 +36,89 @@ class MCTS():
         self.game = game
         self.nnet = nnet
         self.args = args
-        self.Qsa = {}  # stores Q values for s,a (as defined in the paper)
-        self.Nsa = {}  # stores #times edge s,a was visited
-        self.Ns = {}  # stores #times board s was visited
-        self.Ps = {}  # stores initial policy (returned by neural net)
-
+        self.nodes = {}  # stores the Node of each expanded board s
         self.Es = {}  # stores game.getGameEnded ended for board s
-        self.Vs = {}  # stores game.getValidMoves for board s
 
-    def getActionProb(self, canonicalBoard, temp=1):
+    def getActionProb(self, canonicalBoard, temp=1, sparse=False):
         """
         This function performs numMCTSSims simulations of MCTS starting from
         canonicalBoard.
 
+        If args.reuseTree is set, canonicalBoard first becomes the root of the
+        search tree (see advanceRoot) and the simulations inherited from the
+        previous searches count towards numMCTSSims.
+
         Returns:
             probs: a policy vector where the probability of the ith action is
-                   proportional to Nsa[(s,a)]**(1./temp)
+                   proportional to Nsa[(s,a)]**(1./temp), or if sparse is set,
+                   an (actions, probs) tuple of the actions with a non-zero
+                   probability (in ascending order) and their probabilities
         """
-        for i in range(self.args.numMCTSSims):
-            self.search(canonicalBoard)
+        numSims = self.args.numMCTSSims
+        if self.args.get('reuseTree', False):
+            inherited = self.advanceRoot(canonicalBoard)
+            log.debug(f'Inherited {inherited} simulations, keeping {len(self.nodes)} nodes')
+            numSims = max(numSims - inherited, 0)
+
+        if self.args.get('mctsBatchSize', 1) > 1:
+            self.searchBatch(canonicalBoard, numSims)
+        else:
+            for i in range(numSims):
+                self.search(canonicalBoard)
 
         s = self.game.stringRepresentation(canonicalBoard)
-        counts = [self.Nsa[(s, a)] if (s, a) in self.Nsa else 0 for a in range(self.game.getActionSize())]
+        node = self.nodes[s]
 
         if temp == 0:
-            bestAs = np.array(np.argwhere(counts == np.max(counts))).flatten()
-            bestA = np.random.choice(bestAs)
-            probs = [0] * len(counts)
-            probs[bestA] = 1
-            return probs
+            bestAs = node.actions[node.N == np.max(node.N)]
+            actions = np.array([np.random.choice(bestAs)])
+            probs = np.ones(1)
+        else:
+            visited = node.N > 0
+            actions = node.actions[visited]
+            counts = node.N[visited] ** (1. / temp)
+            probs = counts / np.sum(counts)
+
+        if sparse:
+            return actions, probs
 
-        counts = [x ** (1. / temp) for x in counts]
-        counts_sum = float(sum(counts))
-        probs = [x / counts_sum for x in counts]
-        return probs
+        dense = np.zeros(self.game.getActionSize())
+        dense[actions] = probs
+        return dense
 
-    def search(self, canonicalBoard):
+    def advanceRoot(self, canonicalBoard):
+        """
+        Makes canonicalBoard the root of the search tree. The statistics of
+        the states that can be reached from it through previously searched
+        edges (i.e. its subtree) are kept, and everything else is discarded.
+
+        This is typically called with the board reached after a move (or a
+        move and the opponent's reply) was played from the previous root.
+
+        Returns:
+            inherited: the number of simulations that were already performed
+                       through canonicalBoard
+        """
+        root = self.game.stringRepresentation(canonicalBoard)
+
+        reachable = set()
+        stack = [root]
+        while stack:
+            s = stack.pop()
+            if s not in reachable:
+                reachable.add(s)
+                node = self.nodes.get(s)
+                if node is not None:
+                    stack.extend(node.children.values())
+
+        self.nodes = {s: self.nodes[s] for s in reachable if s in self.nodes}
+        self.Es = {s: self.Es[s] for s in reachable if s in self.Es}
+
+        # The first simulation through a node expands it without visiting it
+        node = self.nodes.get(root)
+        return node.visits + 1 if node is not None else 0
+
+    def search(self, canonicalBoard, s=None):
         """
         This function performs one iteration of MCTS. It is recursively called
         till a leaf node is found. The action chosen at each node is one that
@@ -61,8 +127,8 @@ class MCTS():
         Once a leaf node is found, the neural network is called to return an
         initial policy P and a value v for the state. This value is propagated
         up the search path. In case the leaf node is a terminal state, the
-        outcome is propagated up the search path. The values of Ns, Nsa, Qsa are
-        updated.
+        outcome is propagated up the search path. The visit counts and Q values
+        of the nodes on the path are updated.
 
         NOTE: the return values are the negative of the value of the current
         state. This is done since v is in [-1,1] and if v is the value of a
@@ -72,7 +138,8 @@ class MCTS():
             v: the negative of the value of the current canonicalBoard
         """
 
-        s = self.game.stringRepresentation(canonicalBoard)
+        if s is None:
+            s = self.game.stringRepresentation(canonicalBoard)
 
         if s not in self.Es:
             self.Es[s] = self.game.getGameEnded(canonicalBoard, 1)
@@ -80,57 +147,160 @@ class MCTS():
             # terminal node
             return -self.Es[s]
 
-        if s not in self.Ps:
+        node = self.nodes.get(s)
+        if node is None:
             # leaf node
-            self.Ps[s], v = self.nnet.predict(canonicalBoard)
-            valids = self.game.getValidMoves(canonicalBoard, 1)
-            self.Ps[s] = self.Ps[s] * valids  # masking invalid moves
-            sum_Ps_s = np.sum(self.Ps[s])
-            if sum_Ps_s > 0:
-                self.Ps[s] /= sum_Ps_s  # renormalize
-            else:
-                # if all valid moves were masked make all valid moves equally probable
-
-                # NB! All valid moves may be masked if either your NNet architecture is insufficient or you've get overfitting or something else.
-                # If you have got dozens or hundreds of these messages you should pay attention to your NNet and/or training process.   
-                log.error("All valid moves were masked, doing a workaround.")
-                self.Ps[s] = self.Ps[s] + valids
-                self.Ps[s] /= np.sum(self.Ps[s])
-
-            self.Vs[s] = valids
-            self.Ns[s] = 0
+            pi, v = self.nnet.predict(canonicalBoard)
+            self.expand(s, canonicalBoard, pi)
             return -v
 
-        valids = self.Vs[s]
-        cur_best = -float('inf')
-        best_act = -1
+        i = self.selectAction(node)
+        next_s, next_player = self.game.getNextState(canonicalBoard, 1, node.actions[i])
+        next_s = self.game.getCanonicalForm(next_s, next_player)
+        node.children[i] = self.game.stringRepresentation(next_s)
+
+        v = self.search(next_s, node.children[i])
+
+        self.update(node, i, v)
+        return -v
+
+    def searchBatch(self, canonicalBoard, numSims):
+        """
+        This function performs numSims iterations of MCTS starting from
+        canonicalBoard, evaluating the leaf nodes in batches.
+
+        Each round descends up to args.mctsBatchSize paths from the root. A
+        virtual loss of args.virtualLoss is applied along each path while it is
+        pending, which discourages the following descents in the round from
+        selecting the same actions. The pending leaf nodes are then evaluated
+        with a single call to the neural network and their values are
+        propagated up their search paths, removing the virtual losses. A round
+        ends early if a descent reaches a leaf node that is already pending.
+        """
+        batchSize = self.args.mctsBatchSize
+
+        sims = 0
+        while sims < numSims:
+            leaves = {}  # pending leaf nodes s -> (canonical board, search path)
+            for _ in range(min(batchSize, numSims - sims)):
+                path, board, s = self.descend(canonicalBoard)
 
-        # pick the action with the highest upper confidence bound
-        for a in range(self.game.getActionSize()):
-            if valids[a]:
-                if (s, a) in self.Qsa:
-                    u = self.Qsa[(s, a)] + self.args.cpuct * self.Ps[s][a] * math.sqrt(self.Ns[s]) / (
-                            1 + self.Nsa[(s, a)])
+                if self.Es[s] != 0:
+                    # terminal node
+                    self.backup(path, -self.Es[s])
+                    sims += 1
+                elif s in leaves:
+                    # collision with a pending leaf node, so evaluate the batch
+                    self.backup(path, None)
+                    break
                 else:
-                    u = self.args.cpuct * self.Ps[s][a] * math.sqrt(self.Ns[s] + EPS)  # Q = 0 ?
+                    leaves[s] = (board, path)
 
-                if u > cur_best:
-                    cur_best = u
-                    best_act = a
+            if leaves:
+                boards = [board for board, _ in leaves.values()]
+                pis, vs = self.nnet.predict_batch(boards)
 
-        a = best_act
-        next_s, next_player = self.game.getNextState(canonicalBoard, 1, a)
-        next_s = self.game.getCanonicalForm(next_s, next_player)
+                for (s, (board, path)), pi, v in zip(leaves.items(), pis, vs):
+                    self.expand(s, board, pi)
+                    self.backup(path, -v)
+                sims += len(leaves)
+
+    def descend(self, canonicalBoard):
+        """
+        Follows the actions with the maximum upper confidence bound from
+        canonicalBoard until a leaf or terminal node is found, applying a
+        virtual loss to every edge on the way.
+
+        Returns:
+            path: the list of (node, i) edges that were followed, where i is
+                  the position of the action in node.actions
+            board: the canonical board of the leaf or terminal node
+            s: the string representation of board
+        """
+        path = []
+        board = canonicalBoard
+
+        while True:
+            s = self.game.stringRepresentation(board)
+            if path:
+                parent, i = path[-1]
+                parent.children[i] = s
+
+            if s not in self.Es:
+                self.Es[s] = self.game.getGameEnded(board, 1)
+            node = self.nodes.get(s)
+            if self.Es[s] != 0 or node is None:
+                return path, board, s
 
-        v = self.search(next_s)
+            i = self.selectAction(node)
+            path.append((node, i))
+            node.VL[i] += 1
+            node.pending += 1
 
-        if (s, a) in self.Qsa:
-            self.Qsa[(s, a)] = (self.Nsa[(s, a)] * self.Qsa[(s, a)] + v) / (self.Nsa[(s, a)] + 1)
-            self.Nsa[(s, a)] += 1
+            next_s, next_player = self.game.getNextState(board, 1, node.actions[i])
+            board = self.game.getCanonicalForm(next_s, next_player)
+
+    def backup(self, path, v):
+        """
+        Removes the virtual losses applied by descend along path and, unless v
+        is None, propagates the value v (the negative of the value of the leaf
+        node) up the path.
+        """
+        for node, i in reversed(path):
+            node.VL[i] -= 1
+            node.pending -= 1
 
+            if v is not None:
+                self.update(node, i, v)
+                v = -v
+
+    def expand(self, s, canonicalBoard, pi):
+        """
+        Creates the node of the leaf s from the policy pi predicted for it,
+        masked to the valid moves of canonicalBoard.
+        """
+        valids = self.game.getValidMoves(canonicalBoard, 1)
+        actions = np.flatnonzero(valids)
+        priors = pi[actions]  # masking invalid moves
+        sum_Ps_s = np.sum(priors)
+        if sum_Ps_s > 0:
+            priors = priors / sum_Ps_s  # renormalize
         else:
-            self.Qsa[(s, a)] = v
-            self.Nsa[(s, a)] = 1
+            # if all valid moves were masked make all valid moves equally probable
 
-        self.Ns[s] += 1
-        return -v
+            # NB! All valid moves may be masked if either your NNet architecture is insufficient or you've get overfitting or something else.
+            # If you have got dozens or hundreds of these messages you should pay attention to your NNet and/or training process.   
+            log.error("All valid moves were masked, doing a workaround.")
+            priors = np.full(len(actions), 1 / len(actions))
+
+        self.nodes[s] = Node(actions, priors)
+
+    def selectAction(self, node):
+        """
+        Returns the position (in node.actions) of the action with the highest
+        upper confidence bound, treating any pending (batched) searches through
+        an edge as args.virtualLoss lost visits.
+        """
+        N, Q, Ns = node.N, node.Q, node.visits
+        if node.pending:
+            virtualLoss = self.args.get('virtualLoss', 1)
+            vl = node.VL * virtualLoss
+            Ns = Ns + node.pending * virtualLoss
+            Q = np.where(vl > 0, (N * Q - vl) / np.maximum(N + vl, 1), Q)
+            N = N + vl
+
+        # pick the action with the highest upper confidence bound (unvisited
+        # edges have Q = 0)
+        u = np.where(N > 0,
+                     Q + self.args.cpuct * node.P * math.sqrt(Ns) / (1 + N),
+                     self.args.cpuct * node.P * math.sqrt(Ns + EPS))
+
+        return int(np.argmax(u))
+
+    def update(self, node, i, v):
+        """
+        Updates the statistics of the ith edge of node with the value v.
+        """
+        node.Q[i] = (node.N[i] * node.Q[i] + v) / (node.N[i] + 1)
+        node.N[i] += 1
+        node.visits += 1
@@ -1,3 +1,6 @@
+import numpy as np
+
+
 class NeuralNet():
     """
     This class specifies the base NeuralNet class. To define your own neural
@@ -11,7 +14,7 @@ class NeuralNet():
     def __init__(self, game):
         pass
 
-    def train(self, examples):
+    def train(self, examples, augment=False):
         """
         This function trains the neural network with examples obtained from
         self-play.
@@ -21,6 +24,9 @@ class NeuralNet():
                       (board, pi, v). pi is the MCTS informed policy vector for
                       the given board, and v is its value. The examples has
                       board in its canonical form.
+            augment: if True, the examples do not include the symmetrical
+                     forms of each board (see Game.getSymmetries), which
+                     should instead be sampled while training.
         """
         pass
 
@@ -36,6 +42,21 @@ class NeuralNet():
         """
         pass
 
+    def predict_batch(self, boards):
+        """
+        Input:
+            boards: a list of boards in their canonical form.
+
+        Returns:
+            pis: an array of policy vectors, one row per board
+            vs: an array of the values of the boards
+
+        Networks that can evaluate several boards at once should override this
+        to do so; by default the boards are evaluated one at a time.
+        """
+        pis, vs = zip(*[self.predict(board) for board in boards])
+        return np.array(pis), np.array(vs).reshape(-1)
+
     def save_checkpoint(self, folder, filename):
         """
         Saves the current neural network (with its parameters) in
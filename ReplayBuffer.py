@@ -0,0 +1,164 @@
+import os
+import re
+import shutil
+
+import numpy as np
+
+
+class ReplayBuffer():
+    """
+    This class stores the self-play examples of each iteration on disk as
+    fixed-dtype NumPy columns, in a folder of append-only files per iteration,
+    and reads them back as memory-mapped arrays. Saving an iteration only writes
+    that iteration's files, and opening the buffer only maps the files.
+
+    The boards of the examples must provide board_2d and captures (as
+    blooms/BloomsLogic.Board does). The columns of an iteration with N examples
+    whose policies have nnz non-zero entries in total are:
+
+        boards:     int8    (N, x, y)   the board_2d of each example
+        captures:   int16   (N, 2)      the captures of each example
+        values:     float32 (N,)        the value of each example
+        iterations: int32   (N,)        the iteration of each example
+        pi_offsets: int64   (N + 1,)    the start of each example's policy entries
+        pi_actions: int32   (nnz,)      the actions with a non-zero probability
+        pi_probs:   float16 (nnz,)      the probabilities of those actions
+    """
+
+    def __init__(self, folder, actionSize):
+        self.folder = folder
+        self.actionSize = actionSize
+        self.iterations = {}  # iteration -> dict of the memory-mapped columns
+
+    def load(self):
+        """
+        Maps the iterations already saved in the buffer's folder.
+        """
+        if os.path.isdir(self.folder):
+            for name in sorted(os.listdir(self.folder)):
+                match = re.fullmatch(r'iter_(\d+)', name)
+                if match:
+                    self.iterations[int(match.group(1))] = self.openIteration(os.path.join(self.folder, name))
+
+    def addIteration(self, iteration, examples):
+        """
+        Writes the examples of an iteration (a list of (board, pi, v) tuples,
+        where pi is a sparse (actions, probs) policy or a policy vector) to disk
+        and maps them into the buffer.
+        """
+        examples = list(examples)
+        actions, probs = [], []
+        for _, pi, _ in examples:
+            if not isinstance(pi, tuple):
+                pi = np.asarray(pi)
+                pi = np.flatnonzero(pi), pi[np.flatnonzero(pi)]
+            actions.append(np.asarray(pi[0]))
+            probs.append(np.asarray(pi[1]))
+
+        columns = {
+            'boards': np.array([board.board_2d for board, _, _ in examples], dtype=np.int8),
+            'captures': np.array([board.captures for board, _, _ in examples], dtype=np.int16).reshape(-1, 2),
+            'values': np.array([v for _, _, v in examples], dtype=np.float32),
+            'iterations': np.full(len(examples), iteration, dtype=np.int32),
+            'pi_offsets': np.concatenate([[0], np.cumsum([len(a) for a in actions])]).astype(np.int64),
+            'pi_actions': np.concatenate([np.zeros(0)] + actions).astype(np.int32),
+            'pi_probs': np.concatenate([np.zeros(0)] + probs).astype(np.float16),
+        }
+
+        # Write to a temporary folder first, so that an interrupted save never
+        # leaves a partial iteration behind
+        path = os.path.join(self.folder, 'iter_%05d' % iteration)
+        tmpPath = path + '.tmp'
+        os.makedirs(tmpPath, exist_ok=True)
+        for name, column in columns.items():
+            np.save(os.path.join(tmpPath, name + '.npy'), column)
+        if os.path.exists(path):
+            shutil.rmtree(path)
+        os.rename(tmpPath, path)
+
+        self.iterations[iteration] = self.openIteration(path)
+
+    def nextIteration(self):
+        return max(self.iterations, default=-1) + 1
+
+    def openIteration(self, path):
+        return {name[:-len('.npy')]: np.load(os.path.join(path, name), mmap_mode='r')
+                for name in os.listdir(path) if name.endswith('.npy')}
+
+    def window(self, numIterations):
+        """
+        Returns:
+            window: an ExampleWindow over the examples of the latest
+                    numIterations iterations in the buffer
+        """
+        latest = sorted(self.iterations)[-numIterations:]
+        return ExampleWindow([self.iterations[i] for i in latest], self.actionSize)
+
+    def __len__(self):
+        return len(self.iterations)
+
+
+class ExampleWindow():
+    """
+    A read-only view of the examples of one or more iterations of a
+    ReplayBuffer, from which (batches of) examples can be gathered by index.
+    """
+
+    def __init__(self, parts, actionSize):
+        self.parts = parts
+        self.actionSize = actionSize
+        self.starts = np.cumsum([0] + [len(part['values']) for part in parts])
+
+    def __len__(self):
+        return int(self.starts[-1])
+
+    def sample(self, ids):
+        """
+        Input:
+            ids: an array of example indices
+
+        Returns:
+            boards: int8 array of the board_2d of each example
+            captures: int16 array of the captures of each example
+            pi_actions: int64 array of the actions of each example's sparse
+                        policy, one row per example padded to the longest policy
+            pi_probs: float32 array of the probabilities of those actions (zero
+                      in the padding)
+            vs: float32 array of the value of each example
+        """
+        ids = np.asarray(ids)
+        parts = np.searchsorted(self.starts, ids, side='right') - 1
+        rows = ids - self.starts[parts]
+
+        counts = np.empty(len(ids), dtype=np.int64)
+        for p in np.unique(parts):
+            offsets = self.parts[p]['pi_offsets']
+            partRows = rows[parts == p]
+            counts[parts == p] = offsets[partRows + 1] - offsets[partRows]
+        width = max(int(counts.max(initial=0)), 1)
+
+        part = self.parts[0]
+        boards = np.empty((len(ids),) + part['boards'].shape[1:], dtype=np.int8)
+        captures = np.empty((len(ids), 2), dtype=np.int16)
+        pi_actions = np.zeros((len(ids), width), dtype=np.int64)
+        pi_probs = np.zeros((len(ids), width), dtype=np.float32)
+        vs = np.empty(len(ids), dtype=np.float32)
+
+        for p in np.unique(parts):
+            part = self.parts[p]
+            selected = np.flatnonzero(parts == p)
+            partRows = rows[selected]
+
+            boards[selected] = part['boards'][partRows]
+            captures[selected] = part['captures'][partRows]
+            vs[selected] = part['values'][partRows]
+
+            # Copy each example's sparse policy entries into the start of its row
+            partCounts = counts[selected]
+            starts = part['pi_offsets'][partRows]
+            positions = np.arange(partCounts.sum()) - np.repeat(np.cumsum(partCounts) - partCounts, partCounts)
+            entries = np.repeat(starts, partCounts) + positions
+            pi_actions[np.repeat(selected, partCounts), positions] = part['pi_actions'][entries]
+            pi_probs[np.repeat(selected, partCounts), positions] = part['pi_probs'][entries]
+
+        return boards, captures, pi_actions, pi_probs, vs
@@ -0,0 +1,80 @@
+"""Use this script to compare the latency of eager and optimized (CPU)
+inference of the Blooms network at batch sizes 1, 8 and 64.
+"""
+import argparse
+import time
+
+import numpy as np
+
+from blooms.BloomsGame import BloomsGame
+from blooms.pytorch import NNet
+from blooms.pytorch.NNet import NNetWrapper
+
+MODES = [('eager', 'float32'), ('optimized', 'float32'), ('optimized', 'bfloat16'), ('optimized', 'int8')]
+BATCH_SIZES = [1, 8, 64]
+
+
+def random_positions(game, n_positions, seed=0):
+    """Play random moves from the initial board, returning the canonical form
+    of each position reached.
+    """
+    rng = np.random.default_rng(seed)
+    board, player = game.getInitBoard(), 1
+    positions = []
+    while len(positions) < n_positions:
+        positions.append(game.getCanonicalForm(board, player))
+        board, player = game.getNextState(board, player, rng.choice(np.flatnonzero(game.getValidMoves(board, player))))
+        if game.getGameEnded(board, player):
+            board, player = game.getInitBoard(), 1
+
+    return positions
+
+
+def time_predictions(nnet, planes, repeats):
+    """Return the median time (in seconds) of predicting planes."""
+    nnet.predict_planes(planes)  # warm up (and build the optimized model)
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        nnet.predict_planes(planes)
+        times.append(time.perf_counter() - start)
+
+    return float(np.median(times))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--size', type=int, default=4, help='the base size of the board')
+    parser.add_argument('--channels', type=int, default=NNet.args.num_channels, help='the number of channels')
+    parser.add_argument('--threads', type=int, default=None, help='the number of torch threads')
+    parser.add_argument('--repeats', type=int, default=20, help='the number of timed predictions per batch size')
+    options = parser.parse_args()
+
+    NNet.args.num_channels = options.channels
+    NNet.args.num_threads = options.threads
+    NNet.args.cuda = False
+
+    game = BloomsGame(size=options.size)
+    nnet = NNetWrapper(game)
+    positions = random_positions(game, max(BATCH_SIZES))
+    planes = np.array([nnet.encode(board) for board in positions])
+    reference = nnet.predict_planes(planes)
+
+    print(f'base {options.size}, {options.channels} channels')
+    print(f'{"mode":<20}{"fc":<10}{"batch":>6}{"ms/batch":>12}{"boards/s":>12}{"max |dpi|":>12}{"max |dv|":>12}')
+    for inference, inference_fc in MODES:
+        NNet.args.inference, NNet.args.inference_fc = inference, inference_fc
+        nnet.inference_model = None
+
+        pis, vs = nnet.predict_planes(planes)
+        pi_error = np.abs(pis - reference[0]).max()
+        v_error = np.abs(vs - reference[1]).max()
+
+        for batch_size in BATCH_SIZES:
+            seconds = time_predictions(nnet, planes[:batch_size], options.repeats)
+            print(f'{inference:<20}{inference_fc:<10}{batch_size:>6}{seconds * 1000:>12.3f}'
+                  f'{batch_size / seconds:>12.0f}{pi_error:>12.2e}{v_error:>12.2e}')
+
+
+if __name__ == '__main__':
+    main()
@@ -9,16 +9,19 @@ from scipy.special import perm
 
 from Game import Game
 
-from blooms.BloomsLogic import Board
+from blooms.BloomsLogic import SWAPPED_COLOUR_TABLE, Board, MoveTable
 
 
 class BloomsGame(Game):
     """This class specifies the Game class for Blooms.
     """
+    symmetry_tables = {}  # the (board, action) symmetry permutations for each board size
+    action_maps = {}  # the action that each action becomes in each symmetrical form, for each board size
 
     def __init__(self, size=4, score_target=15):
         self.size = size
         self.score_target = score_target
+        self.move_table = MoveTable.for_size(size)
 
     def getInitBoard(self):
         """
@@ -63,10 +66,7 @@ class BloomsGame(Game):
         board = board.copy()
 
         # Fetch the action that corresponds to the action index
-        if player == 1:
-            move = board.move_map_player_1.inverse[action]
-        else:
-            move = board.move_map_player_0.inverse[action]
+        move = self.move_table.get_move(action, player=1 if player == 1 else 0)
 
         if board.is_legal_move(move):
             board.execute_move(move, player)
@@ -79,26 +79,26 @@ class BloomsGame(Game):
             board: current board
             player: current player
         Returns:
-            validMoves: a binary vector of length self.getActionSize(), 1 for
-                        moves that are valid from the current board and player,
-                        0 for invalid moves
+            validMoves: a binary (uint8) vector of length self.getActionSize(),
+                        1 for moves that are valid from the current board and
+                        player, 0 for invalid moves
         """
-        player = 0 if player == -1 else 1
-        valid_moves = board.get_legal_moves(player)
+        # Valid moves don't depend on the player since both players' moves
+        # share the same indices
+        table = self.move_table
+        n_cells = table.n_cells
+        empty = board.get_empty_mask()
 
-        # Remove two stone moves for the opening move (i.e. when the board is
-        # empty
-        if np.all(board.board_2d == 0):
-            valid_moves = [m for m in valid_moves if not m[1]]
+        valid_moves_vec = np.zeros(table.n_actions, dtype=np.uint8)
 
-        valid_moves_vec = np.zeros(int(self.getActionSize()))
-        for move in valid_moves:
-            if player == 0:
-                move_idx = board.move_map_player_0[move]
-            else:
-                move_idx = board.move_map_player_1[move]
+        # One stone moves of either colour can be made on any empty space
+        valid_moves_vec[:n_cells] = empty
+        valid_moves_vec[n_cells:2 * n_cells] = empty
 
-            valid_moves_vec[move_idx] = 1
+        # Two stone moves can be made on any ordered pair of distinct empty
+        # spaces, except for the opening move (i.e. when the board is empty)
+        if board.n_empty < n_cells:
+            valid_moves_vec[2 * n_cells:] = np.outer(empty, empty)[table.off_diagonal]
 
         return valid_moves_vec
 
@@ -153,22 +153,9 @@ class BloomsGame(Game):
             return board
         else:
             # We need to switch the POV
-            board.captures.reverse()
-
-            for r in range(board.board_2d.shape[0]):
-                for q in range(board.board_2d.shape[1]):
-                    if board.board_2d[r, q] == board.colours[0][0]:
-                        # Player -1, Colour 1 -> Player 1, Colour 1
-                        board.board_2d[r, q] = board.colours[1][0]
-                    elif board.board_2d[r, q] == board.colours[0][1]:
-                        # Player -1, Colour 2 -> Player 1, Colour 2
-                        board.board_2d[r, q] = board.colours[1][1]
-                    elif board.board_2d[r, q] == board.colours[1][0]:
-                        # Player 1, Colour 1 -> Player -1, Colour 1
-                        board.board_2d[r, q] = board.colours[0][0]
-                    elif board.board_2d[r, q] == board.colours[1][1]:
-                        # Player 1, Colour 1 -> Player -1, Colour 2
-                        board.board_2d[r, q] = board.colours[0][1]
+            board.captures = board.captures[::-1]
+            board.cells = board.cells.translate(SWAPPED_COLOUR_TABLE)
+            board.stone_hash, board.swapped_stone_hash = board.swapped_stone_hash, board.stone_hash
 
             return board
 
@@ -176,66 +163,123 @@ class BloomsGame(Game):
         """
         Input:
             board: current board
-            pi: policy vector of size self.getActionSize()
+            pi: policy vector of size self.getActionSize(), or a sparse
+                (actions, probs) policy (see MCTS.getActionProb)
         Returns:
             symmForms: a list of [(board,pi)] where each tuple is a symmetrical
-                       form of the board and the corresponding pi vector. This
-                       is used when training the neural network from examples.
+                       form of the board and the corresponding pi vector (or
+                       sparse policy). This is used when training the neural
+                       network from examples.
         """
-        shift = self.size - 1
-        transforms = [
-            # new x, new y, new z
-            (0, 1, 2),
-            (1, 0, 2),
-            (2, 1, 0),
-            (0, 2, 1)
-        ]
+        board_perms, action_perms = self.getSymmetryTables()
+        if isinstance(pi, tuple):
+            actions, probs = pi
+            refl_pis = [(action_map[actions], probs) for action_map in self.getActionMaps()]
+        else:
+            pi = np.asarray(pi)
+            refl_pis = [pi[action_perm] for action_perm in action_perms]
 
-        reflected_forms = []
-        for t in transforms:
-            for multiplier in [1]:
-                for n_rotations in range(0, 6):
-                    refl_board = board.copy()
-                    refl_pi = pi.copy()
+        # The (valid) cells that each cell of each symmetrical form is taken from
+        table = self.move_table
+        cell_perms = table.cell_index.ravel()[board_perms[:, table.cell_r * table.cell_index.shape[1] + table.cell_q]]
+        cells = np.frombuffer(board.cells, dtype=np.int8)
 
-                    cache = {}
+        reflected_forms = []
+        for cell_perm, refl_pi in zip(cell_perms, refl_pis):
+            refl_board = board.copy()
+            refl_board.cells = cells[cell_perm].tobytes()
+            refl_board.rehash()
+            reflected_forms.append([refl_board, refl_pi])
 
-                    # Update board
-                    for q in range(board.board_2d.shape[0]):
-                        for r in range(board.board_2d.shape[0]):
-                            if board.is_valid_space(position=(q, r)):
-                                # Transform coordinate
-                                refl_q, refl_r = self.apply_symmetric_transform(board, shift, q, r, n_rotations, t)
+        return reflected_forms
 
-                                # Cache transformed coordinate
-                                cache[(q, r)] = (refl_q, refl_r)
+    def getSymmetriesStacked(self, board, pi):
+        """Return the symmetrical forms of a board and policy vector as stacked
+        arrays, in the same order as getSymmetries, rather than as Board
+        objects. The captures are the same in every form.
 
-                                # print(f'Axial coord: {(q, r)} -> Centred axial coord: {(q - shift, r - shift)} -> Cube coord: {cube_coord} -> Refl cube coord: {tuple(refl_cube_coord)} -> Refl centred axial coord: {(refl_q - shift, refl_r - shift)} -> Refl axial coord: {(refl_q, refl_r)}')
+        :param board: the current board.
+        :param pi: policy vector of size self.getActionSize().
+        :return: a tuple containing a (24, 2n - 1, 2n - 1) array of the
+            board_2d of each form and a (24, action size) array of the policy
+            vector of each form.
+        """
+        board_perms, action_perms = self.getSymmetryTables()
+        boards = board.board_2d.ravel()[board_perms].reshape((len(board_perms),) + board.board_2d.shape)
 
-                                # Update the reflected position on the reflected board
-                                refl_board.board_2d[refl_r, refl_q] = board.board_2d[r, q]
+        return boards, np.asarray(pi)[action_perms]
 
-                    # Update policy vector
-                    for move, move_idx in board.move_map_player_0.items():
-                        # It doesn't matter which player we use since we're not interested in the colour
-                        refl_move = []
-                        for action in move:
-                            if action:
-                                if (action[0], action[1]) in cache.keys():
-                                    refl_q, refl_r = cache[(action[0], action[1])]
-                                else:
-                                    refl_q, refl_r = self.apply_symmetric_transform(board, shift, action[0], action[1], n_rotations, t)
+    def getSymmetryTables(self):
+        """Return the permutations that map a board and a policy vector to
+        each of their 24 symmetrical forms (6 rotations of 4 reflections).
 
-                                refl_move.append((refl_q, refl_r, action[2]))
-                            else:
-                                refl_move.append(tuple())
+        The k-th symmetrical form of a board is
+        board.board_2d.ravel()[board_perms[k]] and that of a policy vector is
+        pi[action_perms[k]]. The tables are built once per board size and
+        shared by all games of that size.
 
-                        refl_move_idx = board.move_map_player_0[tuple(refl_move)]
-                        refl_pi[refl_move_idx] = pi[move_idx]
+        :return: a tuple containing the (24, (2n - 1)^2) board permutations
+            and the (24, action size) policy permutations.
+        """
+        tables = BloomsGame.symmetry_tables.get(self.size)
+        if tables is not None:
+            return tables
 
-                    reflected_forms.append([refl_board, refl_pi])
+        table = self.move_table
+        width = 2 * self.size - 1
+        shift = self.size - 1
+        transforms = [
+            # new x, new y, new z
+            (0, 1, 2),
+            (1, 0, 2),
+            (2, 1, 0),
+            (0, 2, 1)
+        ]
 
-        return reflected_forms
+        board_perms = []
+        action_perms = []
+        action_maps = []
+        for t in transforms:
+            for n_rotations in range(0, 6):
+                # The cell that each cell is moved to by the transform
+                refl_positions = [self.apply_symmetric_transform(Board, shift, q, r, n_rotations, t)
+                                  for q, r in zip(table.cell_q, table.cell_r)]
+                refl_cells = np.array([table.cell_index[r, q] for q, r in refl_positions])
+
+                # Each (valid) element of the reflected board is taken from the
+                # element that is moved onto it (invalid elements are unmoved)
+                board_perm = np.arange(width * width)
+                board_perm[table.cell_r[refl_cells] * width + table.cell_q[refl_cells]] = \
+                    table.cell_r * width + table.cell_q
+                board_perms.append(board_perm)
+
+                # Likewise for the actions, where the spaces (but not the
+                # colours) of each move are moved by the transform
+                refl_cell1 = refl_cells[table.cell1]
+                refl_actions = np.where(table.cell2 < 0,
+                                        table.single_actions[table.slot1, refl_cell1],
+                                        table.pair_actions[refl_cell1, refl_cells[table.cell2]])
+                action_perm = np.empty(table.n_actions, dtype=np.int64)
+                action_perm[refl_actions] = np.arange(table.n_actions)
+                action_perms.append(action_perm)
+                action_maps.append(refl_actions)
+
+        BloomsGame.action_maps[self.size] = np.array(action_maps)
+        tables = BloomsGame.symmetry_tables[self.size] = (np.array(board_perms), np.array(action_perms))
+        return tables
+
+    def getActionMaps(self):
+        """Return the inverse of the policy permutations of getSymmetryTables,
+        which map the actions of a sparse policy to each symmetrical form.
+
+        The k-th symmetrical form of a sparse (actions, probs) policy is
+        (action_maps[k][actions], probs).
+
+        :return: the (24, action size) action maps.
+        """
+        if self.size not in BloomsGame.action_maps:
+            self.getSymmetryTables()
+        return BloomsGame.action_maps[self.size]
 
     def apply_symmetric_transform(self, board, shift, q, r, n_rotations, refl_transform):
         """Apply a rotational and reflective transform to a given position
@@ -273,7 +317,8 @@ class BloomsGame(Game):
         Input:
             board: current board
         Returns:
-            boardString: a quick conversion of board to a string format.
-                         Required by MCTS for hashing.
+            boardString: the (64-bit Zobrist) hash of the board, which the
+                         board keeps up to date as moves are made. Required by
+                         MCTS for hashing.
         """
-        return board.board_2d.tostring() + bytes(board.captures)
+        return board.zobrist_hash()
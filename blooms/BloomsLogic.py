@@ -1,7 +1,5 @@
 """A board class for the game of Blooms.
 """
-import copy
-
 from itertools import permutations
 
 import matplotlib.pyplot as plt
@@ -9,18 +7,195 @@ import numpy as np
 from bidict import bidict
 from matplotlib.patches import Patch, RegularPolygon
 
+# The colour of each colour (0 = empty) when the players' colours are swapped,
+# and the same as a table for bytes.translate
+SWAPPED_COLOURS = (0, 3, 4, 1, 2)
+SWAPPED_COLOUR_TABLE = bytes(SWAPPED_COLOURS) + bytes(range(5, 256))
+
+
+class MoveTable:
+    """An immutable table of every move that can be made on a board of a given
+    size.
+
+    Moves are indexed in the order that Board.get_legal_moves lists them for an
+    empty board: all one stone moves of the player's first colour, all one
+    stone moves of the player's second colour, and then every ordered pair of
+    distinct spaces (first colour, second colour). A move index therefore means
+    the same placement for both players; only the colours differ.
+
+    Tables are shared by every board of the same size, so they should be
+    obtained with MoveTable.for_size rather than constructed directly.
+    """
+    _tables = {}
+
+    def __init__(self, size):
+        """Build the move table for a board of the given size.
+
+        :param size: the size of the board (either base 4, 5, or 6).
+        """
+        self.size = size
+        width = 2 * size - 1
+
+        # Enumerate the valid spaces in the same (row-major) order as
+        # Board.get_empty_spaces
+        r, q = np.mgrid[0:width, 0:width]
+        valid = (q + r >= size - 1) & (4 * size - 4 - q - r >= size - 1)
+        self.cell_q = q[valid]
+        self.cell_r = r[valid]
+        self.n_cells = len(self.cell_q)
+
+        # Map each (r, q) element of the 2D board to its cell index (or -1)
+        self.cell_index = np.full((width, width), -1, dtype=np.int64)
+        self.cell_index[valid] = np.arange(self.n_cells)
+
+        # The indices of the (up to six) cells neighbouring each cell
+        axial_directions = [(1, 0), (1, -1), (0, -1), (-1, 0), (-1, 1), (0, 1)]
+        self.neighbours = tuple(
+            tuple(int(self.cell_index[r + dr, q + dq]) for dq, dr in axial_directions
+                  if 0 <= q + dq < width and 0 <= r + dr < width and self.cell_index[r + dr, q + dq] >= 0)
+            for q, r in zip(self.cell_q, self.cell_r))
+
+        # Forward lookup: action index -> (cell1, colour slot of cell1, cell2).
+        # Two stone moves always place the first colour on cell1 and the second
+        # colour on cell2, and one stone moves have cell2 == -1.
+        cells = np.arange(self.n_cells)
+        self.off_diagonal = ~np.eye(self.n_cells, dtype=bool)
+        first, second = np.nonzero(self.off_diagonal)
+        self.cell1 = np.concatenate([cells, cells, first])
+        self.slot1 = np.concatenate([np.zeros(self.n_cells, dtype=np.int64),
+                                     np.ones(self.n_cells, dtype=np.int64),
+                                     np.zeros(len(first), dtype=np.int64)])
+        self.cell2 = np.concatenate([np.full(2 * self.n_cells, -1), second])
+        self.n_actions = len(self.cell1)
+
+        # Reverse lookup: (colour slot, cell) -> action index for one stone
+        # moves and (cell1, cell2) -> action index for two stone moves.
+        self.single_actions = np.arange(2 * self.n_cells).reshape(2, self.n_cells)
+        self.pair_actions = np.full((self.n_cells, self.n_cells), -1, dtype=np.int64)
+        self.pair_actions[first, second] = np.arange(2 * self.n_cells, self.n_actions)
+
+        # Zobrist keys for hashing boards (see Board.zobrist_hash): one for
+        # each colour on each cell (colour 0, i.e. empty, has the key 0) and
+        # one for each number of captures (modulo n_capture_keys) of each
+        # player. The seed is fixed so that hashes agree between processes.
+        rng = np.random.default_rng(size)
+        uint64_max = np.iinfo(np.uint64).max
+        self.colour_keys = rng.integers(1, uint64_max, size=(self.n_cells, 5), dtype=np.uint64, endpoint=True)
+        self.colour_keys[:, 0] = 0
+        self.n_capture_keys = 1024
+        self.capture_keys = rng.integers(1, uint64_max, size=(2, self.n_capture_keys), dtype=np.uint64, endpoint=True)
+
+        # The same keys as Python ints, for updating hashes one stone at a time
+        self.colour_key_list = self.colour_keys.tolist()
+        self.capture_key_list = self.capture_keys.tolist()
+
+        for array in (self.cell_q, self.cell_r, self.cell_index, self.off_diagonal, self.cell1, self.slot1,
+                      self.cell2, self.single_actions, self.pair_actions, self.colour_keys, self.capture_keys):
+            array.flags.writeable = False
+
+        self._move_maps = {}
+
+    @classmethod
+    def for_size(cls, size):
+        """Return the (shared) move table for a board of the given size,
+        building it on first use.
+
+        :param size: the size of the board (either base 4, 5, or 6).
+        :return: the MoveTable for the given size.
+        """
+        table = cls._tables.get(size)
+        if table is None:
+            table = cls._tables[size] = cls(size)
+        return table
+
+    def __reduce__(self):
+        # Pickle tables by size so that unpickled boards share the process-wide
+        # table instead of carrying their own copy of the arrays
+        return MoveTable.for_size, (self.size,)
+
+    def __len__(self):
+        return self.n_actions
+
+    def get_move(self, action, player):
+        """Return the move that corresponds to the given action index.
+
+        :param action: the index of the move.
+        :param player: 0 or 1 to denote the player making the move.
+        :return: the move as a tuple of the form
+            ((q coord, r coord, colour), (q coord, r coord, colour)) or
+            ((q coord, r coord, colour), ()).
+        """
+        cell1, cell2 = self.cell1[action], self.cell2[action]
+        placement1 = (int(self.cell_q[cell1]), int(self.cell_r[cell1]), 2 * player + int(self.slot1[action]) + 1)
+        if cell2 < 0:
+            return placement1, ()
+
+        return placement1, (int(self.cell_q[cell2]), int(self.cell_r[cell2]), 2 * player + 2)
+
+    def get_action(self, move, player):
+        """Return the action index that corresponds to the given move.
+
+        :param move: a move of the form
+            ((q coord, r coord, colour), (q coord, r coord, colour)) or
+            ((q coord, r coord, colour), ()).
+        :param player: 0 or 1 to denote the player making the move.
+        :return: the index of the move.
+        :raises KeyError: if the move cannot be made by the given player.
+        """
+        slots = []
+        cells = []
+        for placement in move:
+            if placement:
+                q, r, colour = placement
+                width = self.cell_index.shape[0]
+                cell = self.cell_index[r, q] if 0 <= q < width and 0 <= r < width else -1
+                if cell < 0 or colour not in (2 * player + 1, 2 * player + 2):
+                    raise KeyError(move)
+                cells.append(int(cell))
+                slots.append(colour - 2 * player - 1)
+
+        if len(cells) == 1:
+            return int(self.single_actions[slots[0], cells[0]])
+        elif len(cells) == 2 and slots == [0, 1] and cells[0] != cells[1]:
+            return int(self.pair_actions[cells[0], cells[1]])
+        else:
+            raise KeyError(move)
+
+    def move_map(self, player):
+        """Return a bidirectional dictionary which maps every move that can be
+        made by the player to its index.
+
+        This is a convenience for interactive use (the hot paths use the arrays
+        directly). It is built on first use and shared by all boards.
+
+        :param player: 0 or 1 to denote the player in question.
+        :return: a bidict of moves to action indices.
+        """
+        if player not in self._move_maps:
+            self._move_maps[player] = bidict({self.get_move(i, player): i for i in range(self.n_actions)})
+        return self._move_maps[player]
+
 
 class Board:
     """A board class for the game of Blooms.
+
+    Boards are compact: the colour of the stone on each space (0 if it is
+    empty) is held in the immutable int8 bytes `cells`, with one entry per
+    valid space in the order of the board's move table. Copies share their
+    cells and captures until they are changed, so both are replaced (rather
+    than modified in place) whenever the board changes.
+
+    The number of empty spaces is kept up to date as stones are placed and
+    captured, so that checking for legal moves does not scan the board.
     """
+    __slots__ = ('size', 'score_target', 'captures', 'cells', 'move_table', 'stone_hash', 'swapped_stone_hash',
+                 'n_empty', '_empty_cells')
+
+    colours = [(1, 2), (3, 4)]
+
     def __init__(self, size=4, score_target=15):
         """Initialise a new game board.
 
-        The state of the board is represented by a 3D Numpy array, where the
-        first dimension has four elements (one for each color stone) and the
-        second an third dimensions represent a position on the board (in axial
-        coordinates).
-
         :param size: the size of the board (either base 4, 5, or 6).
         :param score_target: the number of 'captures' to win the game. It is
             recommended that the number of captures are 15 for a base 4 board,
@@ -29,35 +204,128 @@ class Board:
         self.size = size
         self.score_target = score_target
         self.captures = [0, 0]
-        self.board_2d = np.zeros((2 * self.size - 1, 2 * self.size - 1))
-        self.colours = [(1, 2), (3, 4)]
+        self.move_table = MoveTable.for_size(self.size)
+        self.cells = bytes(self.move_table.n_cells)
+        self.n_empty = self.move_table.n_cells
+        self._empty_cells = None  # the indices of the empty cells, once needed
 
-        self.move_map_player_0 = self.build_move_map(player=0)
-        self.move_map_player_1 = self.build_move_map(player=1)
+        # The Zobrist hash of the stones on the board, and of the stones with
+        # the players' colours swapped (1 <-> 3, 2 <-> 4), which becomes the
+        # hash of the stones when the point of view is switched
+        self.stone_hash = 0
+        self.swapped_stone_hash = 0
 
     def copy(self):
         """Create and return a copy of the current board state.
 
         :return: a copy of the board state.
         """
-        duplicate = copy.copy(self)
-        duplicate.board_2d = np.copy(self.board_2d)
-        duplicate.captures = copy.deepcopy(self.captures)
+        duplicate = Board.__new__(Board)
+        duplicate.size = self.size
+        duplicate.score_target = self.score_target
+        duplicate.captures = self.captures
+        duplicate.cells = self.cells
+        duplicate.move_table = self.move_table
+        duplicate.stone_hash = self.stone_hash
+        duplicate.swapped_stone_hash = self.swapped_stone_hash
+        duplicate.n_empty = self.n_empty
+        duplicate._empty_cells = self._empty_cells
         return duplicate
 
-    def build_move_map(self, player):
-        """Build a dictionary that specifies the index of each possible move
-        in a binary move vector.
+    def __getstate__(self):
+        return {'size': self.size, 'score_target': self.score_target, 'captures': list(self.captures),
+                'cells': self.cells}
+
+    def __setstate__(self, state):
+        self.size = state['size']
+        self.score_target = state['score_target']
+        self.captures = list(state['captures'])
+        self.move_table = MoveTable.for_size(self.size)
+        if 'cells' in state:
+            self.cells = state['cells']
+            self.rehash()
+        else:
+            # A board pickled before boards were stored as cells
+            self.board_2d = state['board_2d']
 
-        :param player: 0 or 1 to denote the player in question.
-        :return: a dictionary which maps all possible moves that can be many by
-            the player to a unique index that can be used to build a binary
-            vector of valid moves.
+    @property
+    def board_2d(self):
+        """The board as a 2D (int8) Numpy array, where element [r, q] holds
+        the colour of the stone on the space (q, r), or 0 if it is empty or
+        not a space on the board.
+
+        This is a new array, so changes to it only affect the board when it is
+        assigned back to board_2d.
+        """
+        table = self.move_table
+        board_2d = np.zeros(table.cell_index.shape, dtype=np.int8)
+        board_2d[table.cell_r, table.cell_q] = np.frombuffer(self.cells, dtype=np.int8)
+        return board_2d
+
+    @board_2d.setter
+    def board_2d(self, board_2d):
+        table = self.move_table
+        self.cells = np.asarray(board_2d)[table.cell_r, table.cell_q].astype(np.int8).tobytes()
+        self.rehash()
+
+    def get_colour(self, position):
+        """Return the colour of the stone on the given space.
+
+        :param position: A tuple representing the (q, r) coord of the space.
+        :return: the colour of the stone (1, 2, 3, or 4), or 0 if the space is
+            empty.
         """
-        all_moves = self.get_legal_moves(player)
-        move_map = bidict({m: i for i, m in enumerate(all_moves)})
+        q, r = position
+        return self.cells[self.move_table.cell_index[r, q]]
 
-        return move_map
+    def zobrist_hash(self):
+        """Return a 64-bit hash of the board state (the stones and the number
+        of captures of each player).
+
+        :return: the hash of the board as an int.
+        """
+        keys = self.move_table.capture_key_list
+        n_keys = self.move_table.n_capture_keys
+        return self.stone_hash ^ keys[0][self.captures[0] % n_keys] ^ keys[1][self.captures[1] % n_keys]
+
+    def update_hash(self, cell, colour):
+        """Add (or remove) a stone of the given colour on the given cell to
+        (or from) the hashes of the stones.
+
+        :param cell: the index of the cell in the board's move table.
+        :param colour: the colour of the stone (1, 2, 3, or 4).
+        """
+        keys = self.move_table.colour_key_list[cell]
+        self.stone_hash ^= keys[colour]
+        self.swapped_stone_hash ^= keys[SWAPPED_COLOURS[colour]]
+
+    def rehash(self):
+        """Recompute the hashes of the stones (and the count of empty spaces)
+        from scratch, which is needed after the cells are replaced directly.
+        """
+        self.n_empty = self.cells.count(0)
+        self._empty_cells = None
+
+        table = self.move_table
+        cells = np.arange(table.n_cells)
+        colours = np.frombuffer(self.cells, dtype=np.int8).astype(np.int64)
+        self.stone_hash = int(np.bitwise_xor.reduce(table.colour_keys[cells, colours]))
+        self.swapped_stone_hash = int(np.bitwise_xor.reduce(
+            table.colour_keys[cells, np.array(SWAPPED_COLOURS)[colours]]))
+
+    @property
+    def move_map_player_0(self):
+        """A dictionary which maps all possible moves that can be made by
+        Player 0 to a unique index (shared by all boards of this size).
+        """
+        return self.move_table.move_map(player=0)
+
+    @property
+    def move_map_player_1(self):
+        """A dictionary which maps all possible moves that can be made by
+        Player 1 to a unique index (shared by all boards of this size).
+        """
+        return self.move_table.move_map(player=1)
 
     def get_board_3d(self):
         """Converts the board representation into a 3D representation, where
@@ -79,14 +347,30 @@ class Board:
         :return: the list of empty spaces on the board. Each element is the
             coordinate of the space, i.e. (q, r).
         """
-        empty_spaces = []
-        for r in range(self.board_2d.shape[0]):
-            for q in range(self.board_2d.shape[1]):
-                if self.is_valid_space((q, r)) and self.is_empty_space((q, r)):
-                    # (q, r) is a valid space and is empty
-                    empty_spaces.append((q, r))
+        table = self.move_table
+        return [(int(table.cell_q[cell]), int(table.cell_r[cell])) for cell in self.get_empty_cells()]
+
+    def get_empty_cells(self):
+        """Returns the indices of the empty spaces on the board.
+
+        The indices are found once per position and shared with copies of the
+        board until it changes.
+
+        :return: a tuple of the indices (in the board's move table) of the
+            empty spaces, in increasing order.
+        """
+        if self._empty_cells is None:
+            self._empty_cells = tuple(cell for cell, colour in enumerate(self.cells) if colour == 0)
+        return self._empty_cells
+
+    def get_empty_mask(self):
+        """Returns a boolean mask of the empty spaces on the board.
 
-        return empty_spaces
+        :return: a 1D Numpy array with one element per space, in the order of
+            the board's move table cells, that is True where the space is
+            empty.
+        """
+        return np.frombuffer(self.cells, dtype=np.int8) == 0
 
     def is_valid_space(self, position):
         """Check to see if the given position is a valid space on the board.
@@ -113,8 +397,7 @@ class Board:
             stone.
         :return: True if the given position is empty, False otherwise.
         """
-        q, r = position
-        return self.board_2d[r, q] == 0
+        return self.get_colour(position) == 0
 
     def place_stone(self, position, colour):
         """Place a stone on the board.
@@ -127,9 +410,15 @@ class Board:
 
         # Check the position is valid and empty
         assert self.is_valid_space(position)
-        assert self.board_2d[r, q] == 0
+        assert self.is_empty_space(position)
 
-        self.board_2d[r, q] = colour
+        cell = self.move_table.cell_index[r, q]
+        cells = bytearray(self.cells)
+        cells[cell] = colour
+        self.cells = bytes(cells)
+        self.update_hash(cell, int(colour))
+        self.n_empty -= 1
+        self._empty_cells = None
 
     def remove_stone(self, position):
         """Remove a stone from the board.
@@ -142,7 +431,13 @@ class Board:
         # Check that there is a stone at the given position
         assert not self.is_empty_space(position)
 
-        self.board_2d[r, q] = 0
+        cell = self.move_table.cell_index[r, q]
+        cells = bytearray(self.cells)
+        self.update_hash(cell, cells[cell])
+        cells[cell] = 0
+        self.cells = bytes(cells)
+        self.n_empty += 1
+        self._empty_cells = None
 
     def get_legal_moves(self, player):
         """Returns all the legal moves for the given player.
@@ -177,12 +472,7 @@ class Board:
 
         :return: True if there are legal moves, False otherwise.
         """
-        # Check each index (q, r) to see if it is empty.
-        for r in range(self.board_2d.shape[0]):
-            for q in range(self.board_2d.shape[1]):
-                if self.is_valid_space((q, r)) and self.board_2d[r][q] == 0:
-                    # (q, r) is a valid space and is empty
-                    return True
+        return self.n_empty > 0
 
     def is_legal_move(self, move):
         """Check to see if the given move is legal.
@@ -225,44 +515,79 @@ class Board:
             actually unused, but is required for interfacing with the Alpha Zero
             General library.
         """
-        # Place the stones
+        table = self.move_table
+
+        # Place the stones (on a copy of the cells, as they may be shared)
+        cells = bytearray(self.cells)
+        placed = []
         for placement in move:
             if placement:  # Must check this because some moves place only one stone
                 q, r, colour = placement
-                self.board_2d[r, q] = colour
-
-        # Identify blooms
-        blooms = []
-        for r in range(self.board_2d.shape[1]):
-            for q in range(self.board_2d.shape[0]):
-                if self.is_valid_space((q, r)) and self.board_2d[r, q] > 0:
-                    # (q, r) is a valid, non-empty space
-                    if not any(((q, r) in bloom for bloom in blooms)):
-                        # If the stone is not a member of a currently known bloom
-                        colour = self.board_2d[r, q]
-                        bloom = self.find_bloom_members({(q, r)}, colour, (q, r))
-                        blooms.append(bloom)
+                placed.append(int(table.cell_index[r, q]))
+                cells[placed[-1]] = colour
+                self.update_hash(placed[-1], int(colour))
 
-        # Remove any fenced blooms (and increment the # of captured stones)
+        # Placing stones only removes liberties from the blooms that contain
+        # or neighbour them, so these are the only blooms that can have become
+        # fenced
+        candidates = placed + [n for cell in placed for n in table.neighbours[cell]]
+
+        checked = set()
         fenced_blooms = []
-        for bloom in blooms:
-            if self.is_fenced(bloom):
-                bloom = list(bloom)
-                fenced_blooms.append(bloom)
-
-                # Update captures
-                bloom_colour = self.board_2d[bloom[0][1], bloom[0][0]]
-                if bloom_colour in self.colours[0]:
+        for cell in candidates:
+            if cells[cell] > 0 and cell not in checked:
+                bloom, fenced = self.find_bloom(cells, cell)
+                checked.update(bloom)
+                if fenced:
+                    fenced_blooms.append(bloom)
+
+        # Remove any fenced blooms (and increment the # of captured stones)
+        if fenced_blooms:
+            captures = list(self.captures)
+            for bloom in fenced_blooms:
+                if cells[bloom[0]] in self.colours[0]:
                     # Bloom belongs to Player 1, so increment Player 2's captures
-                    self.captures[1] += len(bloom)
+                    captures[1] += len(bloom)
                 else:
                     # Bloom belongs to Player 2, so increment Player 1's captures
-                    self.captures[0] += len(bloom)
-
-        # Remove stones from the board
-        for bloom in fenced_blooms:
-            for position in bloom:
-                self.remove_stone(position)
+                    captures[0] += len(bloom)
+
+                for cell in bloom:
+                    self.update_hash(cell, cells[cell])
+                    cells[cell] = 0
+                self.n_empty += len(bloom)
+            self.captures = captures
+
+        self.cells = bytes(cells)
+        self.n_empty -= len(placed)
+        self._empty_cells = None
+
+    def find_bloom(self, cells, cell):
+        """Find the bloom that the stone on the given cell belongs to and
+        check whether it is fenced.
+
+        :param cells: the colour on each cell of the board (e.g. the board's
+            cells), indexed in the order of the board's move table.
+        :param cell: the index of the cell to start the search from.
+        :return: a tuple containing the list of cell indices in the bloom and
+            True if the bloom is fenced (False otherwise).
+        """
+        neighbours = self.move_table.neighbours
+        colour = cells[cell]
+
+        bloom = [cell]
+        members = {cell}
+        fenced = True
+        for member in bloom:  # bloom grows as new members are found
+            for neighbour in neighbours[member]:
+                neighbour_colour = cells[neighbour]
+                if neighbour_colour == 0:
+                    fenced = False
+                elif neighbour_colour == colour and neighbour not in members:
+                    members.add(neighbour)
+                    bloom.append(neighbour)
+
+        return bloom, fenced
 
     def is_fenced(self, bloom):
         """Check to see if the given bloom is fenced.
@@ -271,8 +596,8 @@ class Board:
         :return: True if the bloom is fenced, False otherwise.
         """
         for position in bloom:
-            for q, r in self.get_neighbours(position):
-                if self.board_2d[r, q] == 0:
+            for neighbour in self.get_neighbours(position):
+                if self.is_empty_space(neighbour):
                     # A neighbouring position is empty
                     return False
 
@@ -308,7 +633,7 @@ class Board:
         :return: The set of all positions with a stone in the bloom.
         """
         neighbours = self.get_neighbours(position)
-        neighbours = {n for n in neighbours if self.board_2d[n[1], n[0]] == colour and n not in bloom}
+        neighbours = {n for n in neighbours if self.get_colour(n) == colour and n not in bloom}
 
         if not neighbours:
             return bloom
@@ -375,11 +700,12 @@ class Board:
         fig, ax = plt.subplots(1, figsize=(5, 5))
         ax.set_aspect('equal')
 
-        for q in range(0, self.board_2d.shape[-1]):
-            for r in range(0, self.board_2d.shape[-1]):
+        board_2d = self.board_2d
+        for q in range(0, board_2d.shape[-1]):
+            for r in range(0, board_2d.shape[-1]):
                 if self.is_valid_space((q, r)):
                     x, y = self.axial_to_pixel(q, r)
-                    colour = self.board_2d[r, q]
+                    colour = board_2d[r, q]
                     face_colour = f'C{int(colour)}' if colour else 'w'
                     hexagon = RegularPolygon((x, y),
                                              numVertices=6,
@@ -61,7 +61,7 @@ class HumanBloomsPlayer():
 
             try:
                 # Check validity of move
-                move_idx = board.move_map_player_0[input_move]
+                move_idx = self.game.move_table.get_action(input_move, player=0)
                 assert valid[move_idx]
             except (KeyError, AssertionError):
                 print('Invalid move.')
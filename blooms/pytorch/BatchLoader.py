@@ -0,0 +1,50 @@
+import queue
+import threading
+
+
+class BatchLoader():
+    """
+    Iterates over the batches made by make_batch(0), ..., make_batch(n - 1),
+    making up to prefetch batches ahead on a background thread, so that the
+    next batch is gathered (and pinned) while the current one is trained on.
+    """
+
+    def __init__(self, make_batch, n_batches, prefetch=2):
+        self.make_batch = make_batch
+        self.n_batches = n_batches
+        self.prefetch = prefetch
+
+    def __len__(self):
+        return self.n_batches
+
+    def __iter__(self):
+        batches = queue.Queue(maxsize=self.prefetch)
+        stop = threading.Event()
+
+        def produce():
+            try:
+                for i in range(self.n_batches):
+                    batch = self.make_batch(i)
+                    while not stop.is_set():
+                        try:
+                            batches.put((batch, None), timeout=0.1)
+                            break
+                        except queue.Full:
+                            pass
+                    if stop.is_set():
+                        return
+            except Exception as e:
+                batches.put((None, e))
+
+        worker = threading.Thread(target=produce, daemon=True)
+        worker.start()
+        try:
+            for _ in range(self.n_batches):
+                batch, error = batches.get()
+                if error is not None:
+                    raise error
+                yield batch
+        finally:
+            # Let the worker finish if the iteration is abandoned early
+            stop.set()
+            worker.join()
@@ -3,20 +3,29 @@ sys.path.append('..')
 from utils import *
 
 
+import copy
+
+import numpy as np
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
+from torch.nn.utils.fusion import fuse_conv_bn_eval, fuse_linear_bn_eval
 
 
 class BloomsNNet(nn.Module):
-    def __init__(self, game, args):
+    def __init__(self, game, args, encoder=None):
         # game params
         self.board_x, self.board_y = game.getBoardSize()
         self.action_size = game.getActionSize()
         self.args = args
+        self.n_planes = encoder.n_planes if encoder is not None else 4
 
         super(BloomsNNet, self).__init__()
-        self.conv1 = nn.Conv2d(4, args.num_channels, 3, stride=1, padding=1)
+        # the factor of each (uint8) input plane (see Encoders.py)
+        plane_scale = encoder.plane_scale if encoder is not None else np.ones(self.n_planes, dtype=np.float32)
+        self.register_buffer('plane_scale', torch.from_numpy(plane_scale).view(1, -1, 1, 1), persistent=False)
+
+        self.conv1 = nn.Conv2d(self.n_planes, args.num_channels, 3, stride=1, padding=1)
         self.conv2 = nn.Conv2d(args.num_channels, args.num_channels, 3, stride=1, padding=1)
         self.conv3 = nn.Conv2d(args.num_channels, args.num_channels, 3, stride=1)
         self.conv4 = nn.Conv2d(args.num_channels, args.num_channels, 3, stride=1)
@@ -38,7 +47,7 @@ class BloomsNNet(nn.Module):
 
     def forward(self, s):
         #                                                           s: batch_size x board_x x board_y
-        s = s.view(-1, 4, self.board_x, self.board_y)                # batch_size x 1 x board_x x board_y
+        s = s.view(-1, self.n_planes, self.board_x, self.board_y) * self.plane_scale  # batch_size x n_planes x board_x x board_y
         s = F.relu(self.bn1(self.conv1(s)))                          # batch_size x num_channels x board_x x board_y
         s = F.relu(self.bn2(self.conv2(s)))                          # batch_size x num_channels x board_x x board_y
         s = F.relu(self.bn3(self.conv3(s)))                          # batch_size x num_channels x (board_x-2) x (board_y-2)
@@ -51,4 +60,70 @@ class BloomsNNet(nn.Module):
         pi = self.fc3(s)                                                                         # batch_size x action_size
         v = self.fc4(s)                                                                          # batch_size x 1
 
-        return F.log_softmax(pi, dim=1), torch.tanh(v)
\ No newline at end of file
+        return F.log_softmax(pi, dim=1), torch.tanh(v)
+
+class InferenceBloomsNNet(nn.Module):
+    """
+    An inference-only copy of a BloomsNNet, with each BatchNorm folded into the
+    convolution or linear layer before it and without dropout. It returns the
+    policy as probabilities rather than log-probabilities.
+    """
+    def __init__(self, nnet):
+        super(InferenceBloomsNNet, self).__init__()
+        training = nnet.training
+        nnet.eval()
+        self.board_x, self.board_y = nnet.board_x, nnet.board_y
+        self.n_planes = nnet.n_planes
+
+        # The plane scale is folded into conv1 along with bn1
+        self.conv1 = fuse_conv_bn_eval(nnet.conv1, nnet.bn1)
+        with torch.no_grad():
+            self.conv1.weight.mul_(nnet.plane_scale.view(1, -1, 1, 1))
+        self.conv2 = fuse_conv_bn_eval(nnet.conv2, nnet.bn2)
+        self.conv3 = fuse_conv_bn_eval(nnet.conv3, nnet.bn3)
+        self.conv4 = fuse_conv_bn_eval(nnet.conv4, nnet.bn4)
+
+        self.fc1 = fuse_linear_bn_eval(nnet.fc1, nnet.fc_bn1)
+        self.fc2 = fuse_linear_bn_eval(nnet.fc2, nnet.fc_bn2)
+        self.fc3 = copy.deepcopy(nnet.fc3)
+        self.fc4 = copy.deepcopy(nnet.fc4)
+        nnet.train(training)
+
+    def forward(self, s):
+        s = s.view(-1, self.n_planes, self.board_x, self.board_y)
+        s = F.relu(self.conv1(s))
+        s = F.relu(self.conv2(s))
+        s = F.relu(self.conv3(s))
+        s = F.relu(self.conv4(s))
+        s = s.flatten(1)
+
+        s = F.relu(self.fc1(s))
+        s = F.relu(self.fc2(s))
+
+        return F.softmax(self.fc3(s), dim=1), torch.tanh(self.fc4(s))
+
+
+class BFloat16Linear(nn.Module):
+    """
+    A linear layer that computes in bfloat16 and returns float32 outputs.
+    """
+    def __init__(self, linear):
+        super(BFloat16Linear, self).__init__()
+        self.linear = copy.deepcopy(linear).to(torch.bfloat16)
+
+    def forward(self, s):
+        return self.linear(s.to(torch.bfloat16)).float()
+
+
+class ProbabilityOutput(nn.Module):
+    """
+    Wraps a network that returns the policy as log-probabilities, returning it
+    as probabilities instead.
+    """
+    def __init__(self, nnet):
+        super(ProbabilityOutput, self).__init__()
+        self.nnet = nnet
+
+    def forward(self, s):
+        pi, v = self.nnet(s)
+        return torch.exp(pi), v
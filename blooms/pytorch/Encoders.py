@@ -0,0 +1,100 @@
+import numpy as np
+
+
+class DenseEncoder():
+    """
+    Encodes a board as one plane per colour, marking the cells that hold a
+    stone of that colour (as Board.get_board_3d does).
+
+    Encoders return uint8 planes, which the network multiplies by plane_scale
+    (one factor per plane) after converting them to floats.
+    """
+    n_planes = 4
+
+    def __init__(self, game):
+        width, height = game.getBoardSize()
+        self.shape = (self.n_planes, width, height)
+        self.plane_scale = np.ones(self.n_planes, dtype=np.float32)
+        self.colours = np.arange(1, 5).reshape(1, 4, 1, 1)
+
+        table = game.move_table
+        self.cell_r, self.cell_q = table.cell_r, table.cell_q
+        # The colour that each colour plane marks, for the board of each player
+        # (the colours of player -1's board are swapped in its canonical form)
+        self.plane_colours = {1: np.array([[1], [2], [3], [4]]), -1: np.array([[3], [4], [1], [2]])}
+
+    def encode(self, board, player=1):
+        """
+        board: the board to encode
+        player: the player to move (1 or -1). The board of player -1 is
+                encoded as its canonical form would be (see
+                BloomsGame.getCanonicalForm), without flipping it.
+
+        Returns the input planes of the board.
+        """
+        planes = np.zeros(self.shape, dtype=np.uint8)
+        self.encode_cells(planes, np.frombuffer(board.cells, dtype=np.int8), board.captures, player)
+        return planes
+
+    def encode_cells(self, planes, cells, captures, player):
+        """
+        Writes the input planes of a board, given its cells and captures (see
+        Board), into planes (which must be zeroed).
+        """
+        planes[:4, self.cell_r, self.cell_q] = cells == self.plane_colours[player]
+
+    def encode_batch(self, boards_2d, captures):
+        """
+        boards_2d: np array of the board_2d of each board
+        captures: np array of the captures of each board, one row per board
+
+        Returns the input planes of each board, as one contiguous array.
+        """
+        planes = np.empty((len(boards_2d),) + self.shape, dtype=np.uint8)
+        np.equal(boards_2d[:, np.newaxis], self.colours, out=planes.view(bool))
+        return planes
+
+
+class HexEncoder(DenseEncoder):
+    """
+    Encodes a board as the colour planes of DenseEncoder, followed by a plane
+    marking the cells of the hexagonal board (the corners of the 2D array are
+    not part of it) and two planes holding the captures that the player to move
+    and their opponent still need to win, scaled by the score target.
+    """
+    n_planes = 7
+
+    def __init__(self, game):
+        super().__init__(game)
+        self.score_target = game.score_target
+        self.plane_scale = np.array([1] * 5 + [1 / self.score_target] * 2, dtype=np.float32)
+
+        table = game.move_table
+        self.on_board = np.zeros(self.shape[1:], dtype=np.uint8)
+        self.on_board[table.cell_r, table.cell_q] = 1
+
+    def encode_cells(self, planes, cells, captures, player):
+        super().encode_cells(planes, cells, captures, player)
+        planes[4] = self.on_board
+
+        own, opponent = (captures[1], captures[0]) if player == 1 else (captures[0], captures[1])
+        planes[5] = min(max(self.score_target - own, 0), 255)
+        planes[6] = min(max(self.score_target - opponent, 0), 255)
+
+    def encode_batch(self, boards_2d, captures):
+        planes = np.empty((len(boards_2d),) + self.shape, dtype=np.uint8)
+        np.equal(boards_2d[:, np.newaxis], self.colours, out=planes[:, :4].view(bool))
+        planes[:, 4] = self.on_board
+
+        # In the canonical form the player to move is player 1, whose captures
+        # are the second entry
+        to_go = np.clip(self.score_target - np.asarray(captures).reshape(-1, 2), 0, 255).astype(np.uint8)
+        planes[:, 5] = to_go[:, 1, np.newaxis, np.newaxis]
+        planes[:, 6] = to_go[:, 0, np.newaxis, np.newaxis]
+        return planes
+
+
+ENCODERS = {
+    'dense': DenseEncoder,
+    'hex': HexEncoder,
+}
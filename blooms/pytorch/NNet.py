@@ -1,3 +1,4 @@
+import copy
 import os
 import sys
 import time
@@ -12,57 +13,118 @@ from NeuralNet import NeuralNet
 import torch
 import torch.optim as optim
 
+from .BatchLoader import BatchLoader
+from .BloomsNNet import BFloat16Linear, InferenceBloomsNNet, ProbabilityOutput
 from .BloomsNNet import BloomsNNet as blooms_net
+from .Encoders import ENCODERS
+from .ResidualBloomsNNet import ResidualBloomsNNet as residual_net
 
 args = dotdict({
     'lr': 0.001,
     'dropout': 0.3,
-    'epochs': 10,
+    'epochs': 10,               # the maximum number of epochs
     'batch_size': 64,
+    'validation_split': 0.05,   # the fraction of the (most recent) examples held out for validation
+    'patience': 2,              # stop after this many epochs without a lower validation loss (None disables)
+    'lr_schedule': None,        # None, 'cosine' (annealed over the epochs) or 'plateau' (halved when validation stalls)
     'cuda': torch.cuda.is_available(),
     'num_channels': 512,
+    'architecture': 'conv',     # 'conv' (BloomsNNet) or 'resnet' (ResidualBloomsNNet)
+    'num_res_blocks': 6,        # the number of residual blocks of the resnet
+    'res_channels': 64,         # the number of channels of the resnet
+    'pair_features': 32,        # the number of features per cell of the resnet's two-stone move scores
+    'encoder': 'dense',         # the input encoding (see Encoders.py): 'dense' (colour planes) or 'hex' (adds board mask and score planes)
+    'inference': 'eager',       # 'eager' or 'optimized' (a frozen TorchScript model with folded BatchNorm, CPU only)
+    'inference_fc': 'float32',  # the precision of fc1/fc2 in the optimized model: 'float32', 'bfloat16' or 'int8'
+    'num_threads': None,        # the number of threads for torch to use on the CPU (None keeps torch's default)
 })
 
 
 class NNetWrapper(NeuralNet):
     def __init__(self, game):
-        self.nnet = blooms_net(game, args)
+        self.encoder = ENCODERS[args.encoder](game)
+        if args.architecture == 'resnet':
+            self.nnet = residual_net(game, args, self.encoder)
+        elif args.architecture == 'conv':
+            self.nnet = blooms_net(game, args, self.encoder)
+        else:
+            raise ValueError(f'Unknown architecture {args.architecture}')
         self.board_x, self.board_y = game.getBoardSize()
         self.action_size = game.getActionSize()
+        self.input_shape = self.encoder.shape
+        self.board_perms, _ = game.getSymmetryTables()
+        self.action_maps = game.getActionMaps()
+        self.inference_model = None  # the optimized copy of nnet (built when first needed)
+
+        if args.num_threads:
+            torch.set_num_threads(args.num_threads)
 
         if args.cuda:
             self.nnet.cuda()
 
-    def train(self, examples):
+    def train(self, examples, augment=False):
         """
-        examples: list of examples, each example is of form (board, pi, v)
+        examples: list of examples, each example is of form (board, pi, v), or
+                  an ExampleWindow of a ReplayBuffer, oldest first
+        augment: if True, the examples are stored without their symmetrical
+                 forms and a random symmetry is applied to each sampled example
+
+        The last args.validation_split of the examples (the most recent games,
+        so that the symmetrical forms of a position are not split) are held out
+        to measure a validation loss after every epoch. Training stops early
+        once it has not improved for args.patience epochs, and the weights of
+        the best epoch are kept.
         """
-        optimizer = optim.Adam(self.nnet.parameters())
+        self.inference_model = None
+        optimizer = optim.Adam(self.nnet.parameters(), lr=args.lr)
+        scheduler = None
+        if args.lr_schedule == 'cosine':
+            scheduler = optim.lr_scheduler.CosineAnnealingLR(optimizer, T_max=args.epochs)
+        elif args.lr_schedule == 'plateau':
+            scheduler = optim.lr_scheduler.ReduceLROnPlateau(optimizer, factor=0.5, patience=0)
+
+        # Encode all the examples once, so that each batch is a single gather
+        planes, pi_actions, pi_probs, vs = self.example_arrays(examples)
+        n_train = len(vs) - int(len(vs) * args.validation_split)
+        validation = planes[n_train:], pi_actions[n_train:], pi_probs[n_train:], vs[n_train:]
 
+        # Augmented examples stand for all of their symmetrical forms, so an
+        # epoch makes a (randomly transformed) pass over them for each form
+        n_forms = len(self.board_perms) if augment else 1
+
+        best_loss, best_state, stale_epochs = np.inf, None, 0
         for epoch in range(args.epochs):
             print('EPOCH ::: ' + str(epoch + 1))
             self.nnet.train()
             pi_losses = AverageMeter()
             v_losses = AverageMeter()
 
-            batch_count = int(len(examples) / args.batch_size)
+            batch_ids = self.epoch_batches(n_train, n_forms)
+            batch_count = len(batch_ids)
+            batch_syms = np.random.randint(len(self.board_perms), size=batch_ids.shape) if augment else None
 
-            t = tqdm(range(batch_count), desc='Training Net')
-            for _ in t:
-                sample_ids = np.random.randint(len(examples), size=args.batch_size)
-                boards, pis, vs = list(zip(*[examples[i] for i in sample_ids]))
-                boards = [b.get_board_3d() for b in boards]
-                boards = torch.FloatTensor(np.array(boards).astype(np.float64))
-                target_pis = torch.FloatTensor(np.array(pis))
-                target_vs = torch.FloatTensor(np.array(vs).astype(np.float64))
+            def make_batch(i):
+                ids = batch_ids[i]
+                batch_planes, batch_actions = planes[ids], pi_actions[ids]
+                if augment:
+                    batch_planes, batch_actions = self.symmetric_forms(batch_planes, batch_actions, batch_syms[i])
+                batch = (torch.from_numpy(batch_planes).float(), torch.from_numpy(batch_actions),
+                         torch.from_numpy(pi_probs[ids]), torch.from_numpy(vs[ids]))
+                if args.cuda:
+                    batch = tuple(x.pin_memory() for x in batch)
+                return batch
 
+            start = time.time()
+            t = tqdm(BatchLoader(make_batch, batch_count), desc='Training Net')
+            for boards, target_actions, target_probs, target_vs in t:
                 # predict
                 if args.cuda:
-                    boards, target_pis, target_vs = boards.contiguous().cuda(), target_pis.contiguous().cuda(), target_vs.contiguous().cuda()
+                    boards, target_vs = boards.cuda(non_blocking=True), target_vs.cuda(non_blocking=True)
+                    target_actions, target_probs = target_actions.cuda(non_blocking=True), target_probs.cuda(non_blocking=True)
 
                 # compute output
                 out_pi, out_v = self.nnet(boards)
-                l_pi = self.loss_pi(target_pis, out_pi)
+                l_pi = self.loss_pi(target_actions, target_probs, out_pi)
                 l_v = self.loss_v(target_vs, out_v)
                 total_loss = l_pi + l_v
 
@@ -76,27 +138,205 @@ class NNetWrapper(NeuralNet):
                 total_loss.backward()
                 optimizer.step()
 
-    def predict(self, board):
+            elapsed = time.time() - start
+            if batch_count:
+                print(f'Trained on {batch_ids.size / elapsed:.0f} samples/sec')
+
+            if len(validation[3]) == 0:
+                if args.lr_schedule == 'cosine':
+                    scheduler.step()
+                continue
+
+            val_pi, val_v = self.validation_loss(*validation)
+            val_loss = val_pi + val_v
+            print(f'Validation Loss_pi={val_pi:.2e} Loss_v={val_v:.2e}')
+
+            if args.lr_schedule == 'cosine':
+                scheduler.step()
+            elif args.lr_schedule == 'plateau':
+                scheduler.step(val_loss)
+
+            if val_loss < best_loss:
+                best_loss, best_state, stale_epochs = val_loss, copy.deepcopy(self.nnet.state_dict()), 0
+            else:
+                stale_epochs += 1
+                if args.patience is not None and stale_epochs >= args.patience:
+                    print(f'Stopping early, no improvement in validation loss for {stale_epochs} epochs')
+                    break
+
+        if best_state is not None:
+            self.nnet.load_state_dict(best_state)
+
+    def epoch_batches(self, n_examples, n_passes=1):
+        """
+        Returns the example indices of the batches of one epoch, one batch per
+        row, made from n_passes shuffled passes over the examples (the last
+        incomplete batch of each pass is dropped, unless it is the only one).
+        """
+        if n_examples < 2:
+            return np.zeros((0, args.batch_size), dtype=np.int64)
+
+        batch_size = min(args.batch_size, n_examples)
+        batch_count = n_examples // batch_size
+        return np.concatenate([np.random.permutation(n_examples)[:batch_count * batch_size].reshape(-1, batch_size)
+                               for _ in range(n_passes)])
+
+    def validation_loss(self, planes, pi_actions, pi_probs, vs):
+        """
+        Returns the mean policy and value losses of the network on the given
+        example arrays (see example_arrays).
+        """
+        self.nnet.eval()
+        pi_losses = AverageMeter()
+        v_losses = AverageMeter()
+        with torch.no_grad():
+            for i in range(0, len(vs), args.batch_size):
+                batch = slice(i, i + args.batch_size)
+                boards = torch.from_numpy(planes[batch]).float()
+                target_actions, target_probs = torch.from_numpy(pi_actions[batch]), torch.from_numpy(pi_probs[batch])
+                target_vs = torch.from_numpy(vs[batch])
+                if args.cuda:
+                    boards, target_vs = boards.cuda(), target_vs.cuda()
+                    target_actions, target_probs = target_actions.cuda(), target_probs.cuda()
+
+                out_pi, out_v = self.nnet(boards)
+                pi_losses.update(self.loss_pi(target_actions, target_probs, out_pi).item(), boards.size(0))
+                v_losses.update(self.loss_v(target_vs, out_v).item(), boards.size(0))
+
+        return pi_losses.avg, v_losses.avg
+
+    def example_arrays(self, examples):
+        """
+        examples: list of examples of the form (board, pi, v), or an
+                  ExampleWindow of a ReplayBuffer
+
+        Returns the examples as arrays, one row per example: the (uint8) input
+        planes of the boards, the actions and probabilities of their sparse
+        policies (see pad_policies) and their (float32) values.
+        """
+        if hasattr(examples, 'sample'):
+            boards_2d, captures, pi_actions, pi_probs, vs = examples.sample(np.arange(len(examples)))
+        else:
+            boards, pis, vs = list(zip(*examples)) if len(examples) else ([], [], [])
+            boards_2d = np.array([b.board_2d for b in boards]).reshape(-1, self.board_x, self.board_y)
+            captures = np.array([b.captures for b in boards]).reshape(-1, 2)
+            pi_actions, pi_probs = self.pad_policies(pis)
+            vs = np.array(vs, dtype=np.float32)
+
+        return self.encoder.encode_batch(boards_2d, captures), pi_actions, pi_probs, vs
+
+    def symmetric_forms(self, planes, pi_actions, syms):
+        """
+        planes: np array of the input planes of each board
+        pi_actions: np array of the actions of the boards' sparse policies, one
+                    row per board (see pad_policies)
+        syms: the symmetry (see BloomsGame.getSymmetryTables) to apply to each board
+
+        Returns the input planes of the given symmetrical form of each board
+        and the corresponding policy actions (the probabilities are unchanged).
+        """
+        board_perms = self.board_perms[syms][:, np.newaxis, :]
+        planes = np.take_along_axis(planes.reshape(planes.shape[:2] + (-1,)), board_perms, axis=2)
+
+        return planes.reshape(-1, *self.input_shape), np.take_along_axis(self.action_maps[syms], pi_actions, axis=1)
+
+    @staticmethod
+    def pad_policies(pis):
+        """
+        pis: list of sparse (actions, probs) policies (or policy vectors)
+
+        Returns an int64 array of the actions and a float32 array of the
+        probabilities of each policy, one row per policy, padded with zero
+        probabilities to the length of the longest policy.
+        """
+        pis = [pi if isinstance(pi, tuple) else (np.flatnonzero(pi), np.asarray(pi)[np.flatnonzero(pi)]) for pi in pis]
+        counts = np.array([len(actions) for actions, _ in pis], dtype=np.int64)
+        width = max(int(counts.max(initial=0)), 1)
+
+        rows = np.repeat(np.arange(len(pis)), counts)
+        columns = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        pi_actions = np.zeros((len(pis), width), dtype=np.int64)
+        pi_probs = np.zeros((len(pis), width), dtype=np.float32)
+        if len(rows):
+            pi_actions[rows, columns] = np.concatenate([actions for actions, _ in pis])
+            pi_probs[rows, columns] = np.concatenate([probs for _, probs in pis])
+
+        return pi_actions, pi_probs
+
+    def predict(self, board, player=1):
         """
         board: np array with board
+        player: the player to move, if board is not in its canonical form (see
+                encode)
+        """
+        pis, vs = self.predict_planes(self.encode(board, player)[np.newaxis])
+        return pis[0], vs[0]
+
+    def predict_batch(self, boards):
+        """
+        boards: list of boards
         """
-        # Start timer
-        start = time.time()
+        return self.predict_planes(np.array([self.encode(board) for board in boards]))
 
-        # Prepare input
-        board_3d = board.get_board_3d()
-        board_3d = torch.FloatTensor(board_3d.astype(np.float64))
-        if args.cuda: board_3d = board_3d.contiguous().cuda()
-        board_3d = board_3d.view(1, 4, self.board_x, self.board_y)
+    def predict_planes(self, planes):
+        """
+        planes: np array of encoded boards (see encode), one per row
+        """
+        planes = torch.from_numpy(planes).float()
+        if args.inference == 'optimized' and not args.cuda:
+            if self.inference_model is None:
+                self.optimize_for_inference()
+            with torch.no_grad():
+                pi, v = self.inference_model(planes)
+
+            return pi.numpy(), v.numpy()[:, 0]
+
+        if args.cuda: planes = planes.contiguous().cuda()
         self.nnet.eval()
         with torch.no_grad():
-            pi, v = self.nnet(board_3d)
+            pi, v = self.nnet(planes)
+
+        return torch.exp(pi).data.cpu().numpy(), v.data.cpu().numpy()[:, 0]
+
+    def optimize_for_inference(self):
+        """
+        Builds the optimized (CPU) inference model from the current weights,
+        traced and frozen with TorchScript. It is rebuilt after training or
+        loading.
+
+        For BloomsNNet, this is an InferenceBloomsNNet (with BatchNorm folded
+        into the layers) whose fc1 and fc2 layers are converted to
+        args.inference_fc. Other networks are frozen as they are, which folds
+        their BatchNorm into the convolutions.
+        """
+        if isinstance(self.nnet, blooms_net):
+            model = InferenceBloomsNNet(self.nnet).cpu()
+            if args.inference_fc == 'int8':
+                model = torch.ao.quantization.quantize_dynamic(model, {'fc1', 'fc2'}, dtype=torch.qint8)
+            elif args.inference_fc == 'bfloat16':
+                model.fc1, model.fc2 = BFloat16Linear(model.fc1), BFloat16Linear(model.fc2)
+            elif args.inference_fc != 'float32':
+                raise ValueError(f'Unknown inference_fc {args.inference_fc}')
+        else:
+            model = ProbabilityOutput(self.nnet)
+
+        training = self.nnet.training
+        with torch.no_grad():
+            example = torch.zeros((1,) + self.input_shape, device=next(model.parameters()).device)
+            self.inference_model = torch.jit.freeze(torch.jit.trace(model.eval(), example))
+        self.nnet.train(training)
 
-        # print('PREDICTION TIME TAKEN : {0:03f}'.format(time.time()-start))
-        return torch.exp(pi).data.cpu().numpy()[0], v.data.cpu().numpy()[0]
+    def encode(self, board, player=1):
+        """
+        board: board to encode as the (uint8) input planes of the network
+        player: the player to move (1 or -1). The board of player -1 is encoded
+                as its canonical form would be, without flipping it.
+        """
+        return self.encoder.encode(board, player)
 
-    def loss_pi(self, targets, outputs):
-        return -torch.sum(targets * outputs) / targets.size()[0]
+    def loss_pi(self, target_actions, target_probs, outputs):
+        # Cross-entropy of the sparse targets, gathering only their actions
+        return -torch.sum(target_probs * outputs.gather(1, target_actions)) / target_probs.size()[0]
 
     def loss_v(self, targets, outputs):
         return torch.sum((targets - outputs.view(-1)) ** 2) / targets.size()[0]
@@ -120,3 +360,4 @@ class NNetWrapper(NeuralNet):
         map_location = None if args.cuda else 'cpu'
         checkpoint = torch.load(filepath, map_location=map_location)
         self.nnet.load_state_dict(checkpoint['state_dict'])
+        self.inference_model = None
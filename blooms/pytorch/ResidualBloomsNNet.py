@@ -0,0 +1,92 @@
+import sys
+sys.path.append('..')
+from utils import *
+
+import math
+
+import numpy as np
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+
+class ResidualBlock(nn.Module):
+    def __init__(self, channels):
+        super(ResidualBlock, self).__init__()
+        self.conv1 = nn.Conv2d(channels, channels, 3, stride=1, padding=1, bias=False)
+        self.bn1 = nn.BatchNorm2d(channels)
+        self.conv2 = nn.Conv2d(channels, channels, 3, stride=1, padding=1, bias=False)
+        self.bn2 = nn.BatchNorm2d(channels)
+
+    def forward(self, s):
+        t = F.relu(self.bn1(self.conv1(s)))
+        t = self.bn2(self.conv2(t))
+        return F.relu(s + t)
+
+
+class ResidualBloomsNNet(nn.Module):
+    """
+    A residual tower with a factorised policy head, as an alternative to
+    BloomsNNet whose size does not grow with the number of actions.
+
+    The policy head scores the single-stone moves from per-cell features (one
+    logit per cell and colour) and the two-stone moves (first cell takes the
+    first colour, second cell the second) with a bilinear term between the
+    features of the two cells plus a per-cell term for each. The logits are
+    gathered into the action order of the game's MoveTable.
+    """
+    def __init__(self, game, args, encoder=None):
+        # game params
+        self.board_x, self.board_y = game.getBoardSize()
+        self.action_size = game.getActionSize()
+        self.args = args
+        self.n_planes = encoder.n_planes if encoder is not None else 4
+        self.pair_features = args.pair_features
+
+        super(ResidualBloomsNNet, self).__init__()
+        # the factor of each (uint8) input plane (see Encoders.py)
+        plane_scale = encoder.plane_scale if encoder is not None else np.ones(self.n_planes, dtype=np.float32)
+        self.register_buffer('plane_scale', torch.from_numpy(plane_scale).view(1, -1, 1, 1), persistent=False)
+
+        # the position of each cell in the flattened board, and the cells of
+        # each two-stone action (in action order)
+        table = game.move_table
+        n_singles = 2 * table.n_cells
+        self.register_buffer('cells', torch.tensor(table.cell_r * self.board_y + table.cell_q), persistent=False)
+        self.register_buffer('pair_first', torch.tensor(table.cell1[n_singles:]), persistent=False)
+        self.register_buffer('pair_second', torch.tensor(table.cell2[n_singles:]), persistent=False)
+
+        channels = args.res_channels
+        self.conv = nn.Conv2d(self.n_planes, channels, 3, stride=1, padding=1, bias=False)
+        self.bn = nn.BatchNorm2d(channels)
+        self.blocks = nn.Sequential(*[ResidualBlock(channels) for _ in range(args.num_res_blocks)])
+
+        self.single_head = nn.Conv2d(channels, 2, 1)
+        self.pair_head = nn.Conv2d(channels, 2 * self.pair_features + 2, 1)
+
+        self.value_conv = nn.Conv2d(channels, channels, 1)
+        self.value_fc1 = nn.Linear(channels, 64)
+        self.value_fc2 = nn.Linear(64, 1)
+
+    def forward(self, s):
+        #                                                           s: batch_size x n_planes x board_x x board_y
+        s = s.view(-1, self.n_planes, self.board_x, self.board_y) * self.plane_scale
+        s = F.relu(self.bn(self.conv(s)))
+        s = self.blocks(s)                                          # batch_size x channels x board_x x board_y
+
+        # Single-stone moves: colour slot x cell
+        singles = self.single_head(s).flatten(2)[:, :, self.cells].flatten(1)          # batch_size x 2n
+
+        # Two-stone moves: the bilinear term of the two cells plus their own terms
+        pairs = self.pair_head(s).flatten(2)[:, :, self.cells]                         # batch_size x (2d + 2) x n
+        first, second = pairs[:, :self.pair_features], pairs[:, self.pair_features:2 * self.pair_features]
+        pair_logits = torch.einsum('bdi,bdj->bij', first, second) / math.sqrt(self.pair_features)
+        pair_logits = pair_logits + pairs[:, -2, :, None] + pairs[:, -1, None, :]     # batch_size x n x n
+        pairs = pair_logits[:, self.pair_first, self.pair_second]                      # batch_size x n(n-1)
+
+        pi = torch.cat([singles, pairs], dim=1)                                        # batch_size x action_size
+
+        v = F.relu(self.value_conv(s)).flatten(2)[:, :, self.cells].mean(2)           # batch_size x channels
+        v = self.value_fc2(F.relu(self.value_fc1(v)))                                  # batch_size x 1
+
+        return F.log_softmax(pi, dim=1), torch.tanh(v)
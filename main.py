@@ -16,17 +16,29 @@ coloredlogs.install(level='INFO')  # Change this to DEBUG to see more info.
 args = dotdict({
     'numIters': 10,
     'numEps': 100,              # Number of complete self-play games to simulate during a new iteration.
+    'numSelfPlayWorkers': 1,    # Number of processes to play the self-play games in (1 plays them in this process).
+    'seed': 0,                  # Seed for the self-play games played by the worker processes.
+    'inferenceServer': False,   # Evaluate the boards of all self-play workers with one batched copy of the network.
+    'inferenceBatchSize': 64,   # Maximum number of boards per forward pass of the inference server.
+    'inferenceMaxWait': 0.002,  # Maximum time (seconds) the inference server waits for a batch to fill.
     'tempThreshold': 15,        #
     'updateThreshold': 0.55,    # During arena playoff, new neural net will be accepted if threshold or more of games are won.
     'maxlenOfQueue': 10000,     # Number of game examples to train the neural networks.
     'numMCTSSims': 100,         # Number of games moves for MCTS to simulate.
     'arenaCompare': 40,         # Number of games to play during arena play to determine if new net will be accepted.
+    'numArenaWorkers': 1,       # Number of processes to play the arena games in.
+    'arenaSPRTDelta': None,     # If set, stop the arena early once the new net's win rate is decided to within updateThreshold +/- this.
     'cpuct': 4,
+    'mctsBatchSize': 1,         # Number of MCTS leaf nodes to evaluate per batched forward pass (1 disables batching).
+    'virtualLoss': 1,           # Number of lost visits applied to each edge of a pending batched search.
+    'reuseTree': True,          # Keep the subtree of the current position between moves (its simulations count towards numMCTSSims).
 
     'checkpoint': './temp/',
     'load_model': False,
     'load_folder_file': ('/dev/models/8x100x50','best.pth.tar'),
     'numItersForTrainExamplesHistory': 20,
+    'replayBuffer': False,      # Store the examples as memory-mapped arrays in checkpoint/replay (instead of pickling the history every iteration).
+    'augmentOnTheFly': False,   # Store one example per position and sample its symmetrical forms when training (instead of storing all 24).
 
 })
 
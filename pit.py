@@ -17,7 +17,7 @@ human = HumanBloomsPlayer(game).play
 model = NNet(game)
 model.load_checkpoint('./notebooks/results/chkpts_board5_24hrs', 'best.pth.tar')
 
-args = dotdict({'numMCTSSims': 100, 'cpuct':1.0})
+args = dotdict({'numMCTSSims': 100, 'cpuct':1.0, 'reuseTree': True})
 mcts = MCTS(game, model, args)
 agent = lambda x: np.argmax(mcts.getActionProb(x, temp=0))
 
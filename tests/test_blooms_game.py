@@ -122,6 +122,38 @@ def test_get_valid_moves():
     assert np.all((valid_moves == 0) | (valid_moves == 1))
 
 
+def test_get_valid_moves_opening():
+    """Check that only one stone moves are valid for the opening move.
+    """
+    game = BloomsGame(size=4)
+    board = game.getInitBoard()
+    n_spaces = 37
+
+    valid_moves = game.getValidMoves(board, player=1)
+    assert np.all(valid_moves[:2 * n_spaces] == 1)
+    assert np.all(valid_moves[2 * n_spaces:] == 0)
+
+
+def test_get_valid_moves_matches_legal_moves():
+    """Check that the valid moves vector marks exactly the legal moves of a
+    partially filled board.
+    """
+    game = BloomsGame(size=4)
+    board = game.getInitBoard()
+
+    board.place_stone((6, 2), colour=1)
+    board.place_stone((3, 3), colour=3)
+    board.place_stone((0, 6), colour=4)
+
+    for player in [-1, 1]:
+        player_idx = 0 if player == -1 else 1
+        expected = np.zeros(game.getActionSize())
+        for move in board.get_legal_moves(player_idx):
+            expected[board.move_table.get_action(move, player_idx)] = 1
+
+        assert np.array_equal(game.getValidMoves(board, player), expected)
+
+
 def test_get_game_ended_win():
     """Check that the function correctly signals a win.
     """
@@ -259,3 +291,126 @@ def test_get_symmetries():
 
     # for relf_board, refl_pi in symmetrical_states:
     #     relf_board.visualise(show_coords=True)
+
+
+def test_get_symmetries_list_policy():
+    """Check that the function accepts a policy given as a list (as returned by
+    MCTS.getActionProb).
+    """
+    game = BloomsGame(size=4, score_target=15)
+    board = game.getInitBoard()
+    board.place_stone(position=(3, 1), colour=1)
+
+    pi = [0.] * game.getActionSize()
+    pi[52] = 1.
+
+    symmetrical_states = game.getSymmetries(board, pi)
+
+    assert len(symmetrical_states) == 24
+    assert symmetrical_states[1][1][37] == 1.
+    assert all([sum(x[1]) == pytest.approx(1.) for x in symmetrical_states])
+
+
+def test_get_symmetries_stacked():
+    """Check that the stacked symmetrical forms match those returned by
+    getSymmetries.
+    """
+    game = BloomsGame(size=4, score_target=15)
+    board = game.getInitBoard()
+
+    board.place_stone(position=(3, 1), colour=1)
+    board.place_stone(position=(5, 1), colour=2)
+    board.place_stone(position=(3, 5), colour=3)
+
+    pi = np.random.random_sample(game.getActionSize())
+
+    boards, pis = game.getSymmetriesStacked(board, pi)
+    symmetrical_states = game.getSymmetries(board, pi)
+
+    assert boards.shape == (24, 7, 7)
+    assert pis.shape == (24, game.getActionSize())
+    for k, (refl_board, refl_pi) in enumerate(symmetrical_states):
+        assert np.array_equal(boards[k], refl_board.board_2d)
+        assert np.array_equal(pis[k], refl_pi)
+
+    # The first form is the identity
+    assert np.array_equal(boards[0], board.board_2d)
+    assert np.array_equal(pis[0], pi)
+
+
+def test_get_symmetries_sparse_policy():
+    """Check that the symmetrical forms of a sparse policy match those of the
+    equivalent policy vector.
+    """
+    game = BloomsGame(size=4, score_target=15)
+    board = game.getInitBoard()
+
+    board.place_stone(position=(3, 1), colour=1)
+    board.place_stone(position=(5, 1), colour=2)
+
+    actions = np.array([3, 40, 75, 1000])
+    probs = np.array([0.1, 0.2, 0.3, 0.4])
+    pi = np.zeros(game.getActionSize())
+    pi[actions] = probs
+
+    dense_forms = game.getSymmetries(board, pi)
+    sparse_forms = game.getSymmetries(board, (actions, probs))
+
+    assert len(sparse_forms) == 24
+    for (dense_board, dense_pi), (sparse_board, (refl_actions, refl_probs)) in zip(dense_forms, sparse_forms):
+        assert np.array_equal(dense_board.board_2d, sparse_board.board_2d)
+        refl_pi = np.zeros(game.getActionSize())
+        refl_pi[refl_actions] = refl_probs
+        assert np.array_equal(refl_pi, dense_pi)
+
+
+def test_string_representation_incremental_hash():
+    """Check that the hash kept up to date by the board during play matches
+    the hash recomputed from scratch, for both points of view.
+    """
+    game = BloomsGame(size=4, score_target=15)
+    rng = np.random.default_rng(0)
+    board = game.getInitBoard()
+    player = 1
+
+    for _ in range(60):
+        action = rng.choice(np.flatnonzero(game.getValidMoves(board, player)))
+        board, player = game.getNextState(board, player, action)
+        canonical_board = game.getCanonicalForm(board, player)
+
+        for b in (board, canonical_board):
+            rehashed = b.copy()
+            rehashed.rehash()
+            assert game.stringRepresentation(b) == game.stringRepresentation(rehashed)
+
+        if game.getGameEnded(board, player):
+            board, player = game.getInitBoard(), 1
+
+
+def test_string_representation_transpositions():
+    """Check that the same position reached by different move orders has the
+    same representation, and that different positions do not.
+    """
+    game = BloomsGame(size=4, score_target=15)
+    board = game.getInitBoard()
+    table = game.move_table
+
+    a = table.single_actions[0, 3]
+    b = table.pair_actions[10, 20]
+    c = table.pair_actions[20, 10]
+
+    first, _ = game.getNextState(board, 1, a)
+    first, _ = game.getNextState(first, -1, b)
+    second, _ = game.getNextState(board, -1, b)
+    second, _ = game.getNextState(second, 1, a)
+    third, _ = game.getNextState(board, 1, a)
+    third, _ = game.getNextState(third, -1, c)
+
+    assert game.stringRepresentation(first) == game.stringRepresentation(second)
+    assert game.stringRepresentation(first) != game.stringRepresentation(third)
+    assert game.stringRepresentation(first) != game.stringRepresentation(game.getCanonicalForm(first, -1))
+
+    # Captures are part of the representation, however large
+    first.captures = [300, 2]
+    second.captures = [2, 300]
+    assert game.stringRepresentation(first) != game.stringRepresentation(second)
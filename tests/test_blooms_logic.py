@@ -2,6 +2,7 @@
 """
 from .context import blooms
 
+import pickle
 from itertools import permutations
 
 import numpy as np
@@ -45,7 +46,7 @@ def test_empty_spaces_partial():
     n = 4
     board = Board(size=n)
 
-    board.board_2d[3, 3] = 1
+    board.place_stone(position=(3, 3), colour=1)
 
     empty_spaces = board.get_empty_spaces()
     assert len(empty_spaces) == 3*n**2 - 3*n
@@ -164,7 +165,7 @@ def test_has_legal_moves_some():
     board = Board(size=n)
 
     # Add a stone to the board for good measure
-    board.board_2d[3, 3] = 1
+    board.place_stone(position=(3, 3), colour=1)
 
     assert board.has_legal_moves()
 
@@ -468,3 +469,170 @@ def test_build_move_map():
     assert len(board.move_map_player_1) == len(moves)
     assert all([type(v) == int for v in board.move_map_player_1.values()])
     assert all([type(k) == tuple for k in board.move_map_player_1.keys()])
+
+
+def test_move_table_shared():
+    """Check that boards of the same size share a single move table.
+    """
+    board1 = Board(size=4)
+    board2 = Board(size=4)
+    board3 = Board(size=5)
+
+    assert board1.move_table is board2.move_table
+    assert board1.move_table is not board3.move_table
+    assert board1.copy().move_table is board1.move_table
+
+
+def test_move_table_matches_legal_moves():
+    """Check that the move table indexes moves in the same order that they are
+    listed by get_legal_moves for an empty board.
+    """
+    board = Board()
+    table = board.move_table
+
+    for player in [0, 1]:
+        moves = board.get_legal_moves(player)
+        assert len(table) == len(moves)
+        for action, move in enumerate(moves):
+            assert table.get_move(action, player) == move
+            assert table.get_action(move, player) == action
+
+
+def test_move_table_get_action_invalid():
+    """Check that an error is raised for moves that are not in the table.
+    """
+    table = Board().move_table
+
+    with pytest.raises(KeyError):
+        # Wrong colour for the player
+        table.get_action(((6, 2, 3), ()), player=0)
+    with pytest.raises(KeyError):
+        # Invalid space
+        table.get_action(((0, 0, 1), ()), player=0)
+    with pytest.raises(KeyError):
+        # Two stones of the same colour
+        table.get_action(((6, 2, 1), (6, 3, 1)), player=0)
+
+
+def test_execute_move_multi_stone_capture():
+    """Check that every stone of a fenced bloom is captured, including when the
+    bloom is fenced by a move that does not touch all of its members.
+    """
+    board = Board()
+
+    # Add a bloom at the edge of the board and fence all but one liberty
+    bloom = [(6, 3), (5, 4)]
+    for position in bloom:
+        board.place_stone(position, colour=3)
+    board.place_stone((6, 2), colour=1)
+    board.place_stone((5, 3), colour=2)
+    board.place_stone((4, 4), colour=1)
+
+    moves = [(4, 5, 1), ()]
+    board.execute_move(moves, player=0)
+
+    assert all(board.is_empty_space(position) for position in bloom)
+    assert board.captures == [2, 0]
+
+
+def test_find_bloom():
+    """Check that the function finds every member of a bloom and whether it is
+    fenced.
+    """
+    board = Board()
+    table = board.move_table
+
+    # Add a bloom
+    bloom = [(3, 2), (3, 3), (3, 4), (4, 3)]
+    for position in bloom:
+        board.place_stone(position, colour=1)
+
+    cells = board.board_2d[table.cell_r, table.cell_q].tolist()
+    actual_bloom, fenced = board.find_bloom(cells, int(table.cell_index[3, 3]))
+
+    assert {(int(table.cell_q[c]), int(table.cell_r[c])) for c in actual_bloom} == set(bloom)
+    assert not fenced
+
+
+def test_copy_is_independent():
+    """Check that changing a copy of a board does not change the original
+    (copies share their state until it changes).
+    """
+    board = Board(size=4)
+    board.place_stone(position=(3, 3), colour=1)
+    duplicate = board.copy()
+
+    duplicate.place_stone(position=(3, 4), colour=2)
+    duplicate.execute_move(((4, 3, 3), (2, 4, 4)), 1)
+
+    assert board.board_2d[4, 3] == 0
+    assert board.board_2d[3, 4] == 0
+    assert board.board_2d[3, 3] == 1
+    assert np.sum(board.board_2d != 0) == 1
+    assert np.sum(duplicate.board_2d != 0) == 4
+
+
+def test_board_2d_round_trip():
+    """Check that the 2D representation is built from (and can be assigned
+    to) the board's cells, and that the hash follows it.
+    """
+    board = Board(size=4)
+    board.place_stone(position=(3, 3), colour=1)
+    board.place_stone(position=(5, 1), colour=4)
+
+    assert len(board.cells) == 37
+    assert board.board_2d.dtype == np.int8
+    assert board.board_2d[3, 3] == 1 and board.board_2d[1, 5] == 4
+
+    duplicate = Board(size=4)
+    duplicate.board_2d = board.board_2d
+    assert duplicate.cells == board.cells
+    assert duplicate.zobrist_hash() == board.zobrist_hash()
+
+
+def test_pickle_board():
+    """Check that boards survive pickling, including boards pickled before
+    they were stored as cells.
+    """
+    board = Board(size=4, score_target=10)
+    board.place_stone(position=(3, 3), colour=2)
+    board.captures = [3, 1]
+
+    unpickled = pickle.loads(pickle.dumps(board))
+    assert unpickled.cells == board.cells
+    assert unpickled.captures == [3, 1]
+    assert unpickled.score_target == 10
+    assert unpickled.zobrist_hash() == board.zobrist_hash()
+
+    old = Board.__new__(Board)
+    old.__setstate__({'size': 4, 'score_target': 10, 'captures': [3, 1], 'board_2d': board.board_2d.astype(float),
+                      'colours': [(1, 2), (3, 4)]})
+    assert old.cells == board.cells
+    assert old.zobrist_hash() == board.zobrist_hash()
+
+
+def test_empty_count_is_maintained():
+    """Check that the count (and indices) of the empty spaces follow stones
+    being placed, removed and captured.
+    """
+    rng = np.random.default_rng(0)
+    board = Board(size=4)
+    assert board.n_empty == 37 and board.get_empty_cells() == tuple(range(37))
+
+    board.place_stone(position=(3, 3), colour=1)
+    board.remove_stone(position=(3, 3))
+    assert board.n_empty == 37
+
+    player = 0
+    while board.has_legal_moves():
+        moves = board.get_legal_moves(player)
+        previous = board.copy()
+        board.execute_move(moves[rng.integers(len(moves))], player)
+
+        assert board.n_empty == board.cells.count(0)
+        assert board.get_empty_cells() == tuple(i for i, colour in enumerate(board.cells) if colour == 0)
+        assert previous.n_empty == previous.cells.count(0)
+        player = 1 - player
+
+    board.board_2d = np.zeros(board.board_2d.shape)
+    assert board.n_empty == 37 and board.has_legal_moves()
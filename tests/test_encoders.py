@@ -0,0 +1,63 @@
+"""Test for the network input encoders.
+"""
+from .context import blooms
+
+import numpy as np
+
+from blooms.BloomsGame import BloomsGame
+from blooms.pytorch.Encoders import DenseEncoder, HexEncoder
+
+
+def make_board(game):
+    board = game.getInitBoard()
+    board.place_stone(position=(3, 1), colour=1)
+    board.place_stone(position=(5, 1), colour=2)
+    board.place_stone(position=(3, 5), colour=3)
+    board.place_stone(position=(1, 4), colour=4)
+    board.captures = [4, 9]
+    return board
+
+
+def test_dense_encoder():
+    """Check that the dense encoding matches the 3D board representation.
+    """
+    game = BloomsGame(size=4, score_target=15)
+    board = make_board(game)
+    planes = DenseEncoder(game).encode(board)
+
+    assert planes.dtype == np.uint8
+    assert np.array_equal(planes, board.get_board_3d())
+
+
+def test_hex_encoder():
+    """Check that the hex encoding adds the board mask and the captures to go
+    of the player to move and their opponent.
+    """
+    game = BloomsGame(size=4, score_target=15)
+    board = make_board(game)
+    encoder = HexEncoder(game)
+    planes = encoder.encode(board)
+
+    assert planes.shape == (7, 7, 7)
+    assert np.array_equal(planes[:4], board.get_board_3d())
+    assert planes[4].sum() == 37
+    assert planes[4, 0, 0] == 0 and planes[4, 3, 3] == 1
+    assert np.all(planes[5] == 15 - 9)
+    assert np.all(planes[6] == 15 - 4)
+
+    batch = encoder.encode_batch(np.array([board.board_2d] * 2), np.array([board.captures] * 2))
+    assert np.array_equal(batch[1], planes)
+
+
+def test_encode_non_canonical_board():
+    """Check that encoding a board for player -1 matches encoding its
+    canonical form.
+    """
+    game = BloomsGame(size=4, score_target=15)
+    board = make_board(game)
+    canonical_board = game.getCanonicalForm(board, -1)
+
+    for encoder in (DenseEncoder(game), HexEncoder(game)):
+        assert np.array_equal(encoder.encode(board, -1), encoder.encode(canonical_board))
+        assert np.array_equal(encoder.encode(board, 1), encoder.encode(game.getCanonicalForm(board, 1)))
+        assert not np.array_equal(encoder.encode(board, -1), encoder.encode(board))
@@ -0,0 +1,84 @@
+"""Test for the ReplayBuffer module.
+"""
+from .context import blooms
+
+import numpy as np
+
+from blooms.BloomsGame import BloomsGame
+from ReplayBuffer import ReplayBuffer
+
+
+def make_examples(game, n_examples):
+    """Generate examples from random play, each with a random sparse policy.
+    """
+    rng = np.random.default_rng(0)
+    board = game.getInitBoard()
+    player = 1
+    examples = []
+    for _ in range(n_examples):
+        valids = game.getValidMoves(board, player)
+        pi = np.zeros(game.getActionSize())
+        actions = rng.choice(np.flatnonzero(valids), size=min(5, valids.sum()), replace=False)
+        pi[actions] = rng.random(len(actions))
+        pi /= pi.sum()
+        examples.append((board, pi, rng.choice([-1, 1])))
+
+        board, player = game.getNextState(board, player, actions[0])
+        if game.getGameEnded(board, player):
+            board, player = game.getInitBoard(), 1
+
+    return examples
+
+
+def test_replay_buffer_round_trip(tmp_path):
+    """Check that examples written to the buffer are read back (after loading
+    it again) with the same boards, captures, policies and values.
+    """
+    game = BloomsGame(size=3, score_target=5)
+    examples = make_examples(game, 30)
+
+    buffer = ReplayBuffer(str(tmp_path), game.getActionSize())
+    buffer.addIteration(buffer.nextIteration(), examples[:10])
+    buffer.addIteration(buffer.nextIteration(), examples[10:])
+
+    loaded = ReplayBuffer(str(tmp_path), game.getActionSize())
+    loaded.load()
+    assert len(loaded) == 2
+    assert loaded.nextIteration() == 2
+
+    window = loaded.window(2)
+    assert len(window) == 30
+
+    ids = np.array([29, 0, 12, 9, 10, 12])
+    boards, captures, pi_actions, pi_probs, vs = window.sample(ids)
+    assert pi_actions.shape == pi_probs.shape == (len(ids), 5)
+    for row, i in enumerate(ids):
+        board, pi, v = examples[i]
+        dense_pi = np.zeros(game.getActionSize())
+        dense_pi[pi_actions[row]] += pi_probs[row]
+        assert np.array_equal(boards[row], board.board_2d)
+        assert tuple(captures[row]) == tuple(board.captures)
+        assert np.allclose(dense_pi, pi, atol=1e-3)
+        assert np.array_equal(dense_pi > 0, pi > 0)
+        assert vs[row] == v
+
+    # The window only covers the latest iterations
+    assert len(loaded.window(1)) == 20
+
+
+def test_replay_buffer_sparse_policies(tmp_path):
+    """Check that sparse (actions, probs) policies are stored like the
+    equivalent policy vectors.
+    """
+    game = BloomsGame(size=3, score_target=5)
+    examples = make_examples(game, 10)
+    sparse_examples = [(board, (np.flatnonzero(pi), pi[np.flatnonzero(pi)]), v) for board, pi, v in examples]
+
+    buffer = ReplayBuffer(str(tmp_path), game.getActionSize())
+    buffer.addIteration(0, examples)
+    buffer.addIteration(1, sparse_examples)
+
+    dense = buffer.window(2).sample(np.arange(10))
+    sparse = buffer.window(2).sample(np.arange(10, 20))
+    for dense_column, sparse_column in zip(dense, sparse):
+        assert np.array_equal(dense_column, sparse_column)
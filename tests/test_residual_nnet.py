@@ -0,0 +1,57 @@
+"""Test for the ResidualBloomsNNet module.
+"""
+from .context import blooms
+
+import math
+
+import numpy as np
+import torch
+
+from blooms.BloomsGame import BloomsGame
+from blooms.pytorch.ResidualBloomsNNet import ResidualBloomsNNet
+from utils import dotdict
+
+args = dotdict({
+    'num_res_blocks': 1,
+    'res_channels': 8,
+    'pair_features': 4,
+})
+
+
+def test_policy_action_order():
+    """Check that the factorised policy logits follow the action order of the
+    move table.
+    """
+    game = BloomsGame(size=3, score_target=5)
+    nnet = ResidualBloomsNNet(game, args).eval()
+    table = game.move_table
+
+    board = game.getInitBoard()
+    board.place_stone(position=(1, 1), colour=1)
+    board.place_stone(position=(2, 3), colour=3)
+    planes = torch.FloatTensor(board.get_board_3d()[np.newaxis])
+
+    # Capture the per-cell features that the policy head scores
+    features = {}
+    nnet.single_head.register_forward_hook(lambda m, i, o: features.update(single=o[0]))
+    nnet.pair_head.register_forward_hook(lambda m, i, o: features.update(pair=o[0]))
+    with torch.no_grad():
+        log_pi, v = nnet(planes)
+    logits = log_pi[0] - log_pi[0].max()
+
+    assert log_pi.shape == (1, game.getActionSize())
+    assert v.shape == (1, 1)
+
+    def logit(action):
+        c1, slot, c2 = table.cell1[action], table.slot1[action], table.cell2[action]
+        r1, q1 = table.cell_r[c1], table.cell_q[c1]
+        if c2 < 0:
+            return features['single'][slot, r1, q1]
+        r2, q2 = table.cell_r[c2], table.cell_q[c2]
+        pair = features['pair']
+        d = args.pair_features
+        return (torch.dot(pair[:d, r1, q1], pair[d:2 * d, r2, q2]) / math.sqrt(d)
+                + pair[-2, r1, q1] + pair[-1, r2, q2])
+
+    expected = torch.stack([logit(a) for a in range(table.n_actions)])
+    assert torch.allclose(logits, expected - expected.max(), atol=1e-5)
@@ -1,3 +1,7 @@
+import os
+from contextlib import contextmanager
+
+
 class AverageMeter(object):
     """From https://github.com/pytorch/examples/blob/master/imagenet/main.py"""
 
@@ -20,3 +24,22 @@ class AverageMeter(object):
 class dotdict(dict):
     def __getattr__(self, name):
         return self[name]
+
+
+@contextmanager
+def childThreadLimit(numThreads=1):
+    """Limits the number of threads used by the numerical libraries (OpenMP,
+    MKL) of any processes spawned within the block, which is inherited through
+    the environment.
+    """
+    threadVars = ('OMP_NUM_THREADS', 'MKL_NUM_THREADS')
+    savedEnv = {var: os.environ.get(var) for var in threadVars}
+    os.environ.update({var: str(numThreads) for var in threadVars})
+    try:
+        yield
+    finally:
+        for var, value in savedEnv.items():
+            if value is None:
+                os.environ.pop(var)
+            else:
+                os.environ[var] = value